@@ -0,0 +1,272 @@
+# bench.py
+"""
+End-to-end benchmarks of the organizer against a local fake Discogs server.
+
+Every scenario runs in its own process (so peak memory is measured per scenario)
+on a freshly generated synthetic library, and reports files per minute, Discogs
+API calls per file, time spent waiting on the rate limiter and peak RSS.
+
+Usage:
+    python bench.py                                  # all scenarios, default sizes
+    python bench.py --files 2000 --latency 0.1 organize
+    python bench.py --save baseline.json             # store the results as a baseline
+    python bench.py --compare baseline.json          # fail if slower than the baseline
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))
+
+# Metrics where a higher value is better; for all others lower is better.
+HIGHER_IS_BETTER = {"files_per_minute", "matched"}
+COMPARED_METRICS = ("files_per_minute", "api_calls_per_file", "sleep_seconds", "peak_rss_mb")
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _setup(config, workdir, unknown=0.05):
+    from fake_discogs import FakeDiscogsServer
+    from synthetic_library import make_catalog, generate_library
+    from discogs_cache import DiscogsCache
+    from discogs_utils import create_discogs_client
+    from rate_limiter import RateLimiter
+
+    catalog = make_catalog(config["releases"], seed=config["seed"])
+    library = os.path.join(workdir, "library")
+    paths = generate_library(library, catalog, files=config["files"], tagged=config["tagged"],
+                             duplicates=config["duplicates"], unknown=unknown, seed=config["seed"])
+    server = FakeDiscogsServer(catalog, latency=config["latency"], jitter=config["jitter"],
+                               rate_limit=config["rate_limit"], error_rate=config["error_rate"]).start()
+    cache = DiscogsCache(os.path.join(workdir, "cache.sqlite3"))
+    limiter = RateLimiter(limit=config["rate_limit"])
+    client = create_discogs_client("benchmark", cache=cache, limiter=limiter)
+    client._base_url = server.url
+    return library, paths, server, cache, limiter, client
+
+
+def scenario_organize(config, workdir):
+    """organize_files (copy) over the whole library with a cold cache."""
+    import organizer
+    from instrumentation import Metrics
+
+    library, paths, server, cache, limiter, client = _setup(config, workdir)
+    results = []
+    metrics = Metrics()
+    started = time.perf_counter()
+    organizer.organize_files(client, library, "copy", log_callback=lambda message: None,
+                             result_callback=results.append, metrics=metrics)
+    elapsed = time.perf_counter() - started
+    matched = sum(1 for result in results if result["release"])
+    report = _report(len(paths), elapsed, server, limiter, matched)
+    report["spans"] = {name: span["total_seconds"] for name, span in metrics.summary()["spans"].items()}
+    return report
+
+
+def scenario_organize_warm(config, workdir, expire=False):
+    """organize_files over a second copy of the library, with the cache filled by the first."""
+    import organizer
+
+    library, paths, server, cache, limiter, client = _setup(config, workdir)
+    organizer.organize_files(client, library, "copy", log_callback=lambda message: None)
+    if expire:
+        with cache._lock:
+            cache._conn.execute("UPDATE entries SET created = 0")
+            cache._conn.commit()
+    from synthetic_library import make_catalog, generate_library
+    second = os.path.join(workdir, "library-2")
+    paths = generate_library(second, make_catalog(config["releases"], seed=config["seed"]), files=config["files"],
+                             tagged=config["tagged"], duplicates=config["duplicates"], seed=config["seed"])
+    server.requests = server.not_modified = 0
+    limiter.time_slept = 0.0
+    results = []
+    started = time.perf_counter()
+    organizer.organize_files(client, second, "copy", log_callback=lambda message: None,
+                             result_callback=results.append)
+    elapsed = time.perf_counter() - started
+    matched = sum(1 for result in results if result["release"])
+    return _report(len(paths), elapsed, server, limiter, matched)
+
+
+def scenario_organize_revalidate(config, workdir):
+    """Like organize-warm, but every cache entry has expired: releases are revalidated with ETags (304s)."""
+    return scenario_organize_warm(config, workdir, expire=True)
+
+
+def scenario_organize_local_index(config, workdir):
+    """
+    organize_files with a local index built from a dump of the whole catalog
+    (iter_releases, LocalIndex.search and search_catno). Every file is in the
+    dump, so the scenario fails if Discogs is asked at all.
+    """
+    import organizer
+    from discogs_dump import LocalIndex, iter_releases
+    from instrumentation import Metrics
+    from synthetic_dump import write_dump
+    from synthetic_library import make_catalog
+
+    library, paths, server, cache, limiter, client = _setup(config, workdir, unknown=0.0)
+    dump = os.path.join(workdir, "releases.xml.gz")
+    write_dump(dump, make_catalog(config["releases"], seed=config["seed"]))
+    started = time.perf_counter()
+    index = LocalIndex(os.path.join(workdir, "index.sqlite3"))
+    index.ingest(iter_releases(dump))
+    ingest_seconds = time.perf_counter() - started
+
+    results = []
+    metrics = Metrics()
+    started = time.perf_counter()
+    organizer.organize_files(client, library, "copy", log_callback=lambda message: None,
+                             result_callback=results.append, metrics=metrics, local_index=index)
+    elapsed = time.perf_counter() - started
+    index.close()
+    matched = sum(1 for result in results if result["release"])
+    report = _report(len(paths), elapsed, server, limiter, matched)
+    if server.requests:
+        raise RuntimeError(f"{server.requests} Discogs API requests; expected none with the local index")
+    report["ingest_seconds"] = round(ingest_seconds, 3)
+    report["spans"] = {name: span["total_seconds"] for name, span in metrics.summary()["spans"].items()}
+    return report
+
+
+def scenario_fetch_release_info(config, workdir):
+    """fetch_release_info for every file, one after the other (the pre-pipeline code path)."""
+    from discogs_utils import fetch_release_info
+
+    library, paths, server, cache, limiter, client = _setup(config, workdir)
+    paths = paths[:config["sequential_files"]]
+    matched = 0
+    started = time.perf_counter()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if fetch_release_info(client, path, name):
+            matched += 1
+    elapsed = time.perf_counter() - started
+    return _report(len(paths), elapsed, server, limiter, matched)
+
+
+def _report(files, elapsed, server, limiter, matched):
+    stats = server.stats()
+    server.stop()
+    return {
+        "files": files,
+        "seconds": round(elapsed, 3),
+        "files_per_minute": round(files / elapsed * 60, 1) if elapsed else None,
+        "api_calls_per_file": round(server.requests / files, 3) if files else None,
+        "throttled": stats["throttled"],
+        "not_modified": stats["not_modified"],
+        "sleep_seconds": round(limiter.time_slept, 2),
+        "matched": matched,
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_rss_children_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+SCENARIOS = {
+    "organize": scenario_organize,
+    "organize-warm": scenario_organize_warm,
+    "organize-revalidate": scenario_organize_revalidate,
+    "organize-local-index": scenario_organize_local_index,
+    "fetch-release-info": scenario_fetch_release_info,
+}
+
+
+def run_scenario(name, config):
+    """Runs one scenario in a child process and returns its report."""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", name, "--config", json.dumps(config)],
+        capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Prints each metric against the baseline. Returns the list of regressions."""
+    regressions = []
+    for name, report in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), report.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if metric in HIGHER_IS_BETTER else change > tolerance
+            print(f"{name:20} {metric:20} {old:>10} -> {new:>10} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((name, metric))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the organizer against a fake Discogs server.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)}).")
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--sequential-files", type=int, default=100,
+                        help="Files used by the sequential fetch-release-info scenario.")
+    parser.add_argument("--releases", type=int, default=200)
+    parser.add_argument("--tagged", type=float, default=0.5, help="Fraction of files with full tags.")
+    parser.add_argument("--duplicates", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake API response.")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--rate-limit", type=int, default=600, help="Requests per minute of the fake API.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="Write the results to this JSON baseline file.")
+    parser.add_argument("--compare", help="Compare the results with this JSON baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression (default: 0.10).")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        with tempfile.TemporaryDirectory(prefix="musicorganizer-bench-") as workdir:
+            report = SCENARIOS[args.child](json.loads(args.config), workdir)
+        print(json.dumps(report))
+        return 0
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    config = {key: getattr(args, key) for key in (
+        "files", "sequential_files", "releases", "tagged", "duplicates", "latency", "jitter",
+        "rate_limit", "error_rate", "seed")}
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        report = run_scenario(name, config)
+        results[name] = report
+        print(f"{name:20} {report['files_per_minute']:>9} files/min  {report['api_calls_per_file']:>6} calls/file"
+              f"  {report['sleep_seconds']:>6}s asleep  {report['peak_rss_mb']:>6} MB peak  ({report['matched']}/{report['files']} matched)")
+
+    document = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                "config": config, "results": results}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Warning: the baseline was recorded with a different configuration.")
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
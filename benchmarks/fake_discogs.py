@@ -0,0 +1,198 @@
+# fake_discogs.py
+"""
+A local stand-in for the Discogs API, serving a synthetic catalog with scripted
+latency, rate-limit headers and 429 responses.
+
+Usage:
+    python fake_discogs.py [--port 8765] [--latency 0.05] [--rate-limit 60] [--releases 200]
+
+Point a client at it with client._base_url = server.url.
+"""
+import argparse
+import collections
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic_library import make_catalog
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _tokens(text):
+    return set(_TOKEN.findall(text.casefold()))
+
+
+class FakeDiscogsServer:
+    """
+    Serves /database/search and /releases/<id> for a catalog from make_catalog.
+    Releases carry an ETag and answer If-None-Match with 304; responses are
+    gzip-compressed when the client accepts it.
+
+    Parameters:
+      - catalog: Release dictionaries (API shape).
+      - latency: Seconds added to every response.
+      - jitter: Up to this many extra seconds, chosen at random per response.
+      - rate_limit: Requests allowed per moving 60 second window; further requests get a 429.
+      - error_rate: Fraction of requests answered with a 429 regardless of the budget.
+      - port: 0 picks a free port.
+    """
+
+    def __init__(self, catalog, latency=0.05, jitter=0.0, rate_limit=60, error_rate=0.0, port=0, seed=1):
+        self.releases = {release["id"]: release for release in catalog}
+        self._index = [
+            (release, _tokens(" ".join([a["name"] for a in release["artists"]] + [release["title"]]
+                                       + [t["title"] for t in release["tracklist"]])))
+            for release in catalog
+        ]
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+        self.paths = collections.Counter()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-discogs", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "not_modified": self.not_modified,
+                    "paths": dict(self.paths)}
+
+    def _admit(self, path):
+        """Counts the request against the moving window. Returns (allowed, used)."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self.paths[path] += 1
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            scripted_error = self.error_rate and self._rng.random() < self.error_rate
+            if len(self._window) >= self.rate_limit or scripted_error:
+                self.throttled += 1
+                return False, len(self._window)
+            self._window.append(now)
+            return True, len(self._window)
+
+    def _search(self, query):
+        per_page = int(query.get("per_page", ["50"])[0])
+        page = int(query.get("page", ["1"])[0])
+        catno = query.get("catno", [""])[0].casefold()
+        wanted = _tokens(" ".join(query.get(k, [""])[0] for k in ("q", "artist", "release_title")))
+        if catno:
+            matches = [r for r, _ in self._index if any(l["catno"].casefold() == catno for l in r["labels"])]
+        else:
+            scored = [(len(wanted & tokens), -release["id"], release) for release, tokens in self._index]
+            matches = [release for score, _, release in sorted(scored, reverse=True) if score > 0]
+        pages = max((len(matches) + per_page - 1) // per_page, 1)
+        results = [
+            {
+                "type": "release",
+                "id": release["id"],
+                "title": f"{release['artists'][0]['name']} - {release['title']}",
+                "catno": release["labels"][0]["catno"],
+                "label": [label["name"] for label in release["labels"]],
+                "year": str(release["year"]),
+                "resource_url": f"{self.url}/releases/{release['id']}",
+            }
+            for release in matches[(page - 1) * per_page:page * per_page]
+        ]
+        return {"pagination": {"page": page, "pages": pages, "per_page": per_page, "items": len(matches)},
+                "results": results}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                allowed, used = server._admit(parts.path.rsplit("/", 1)[0] if parts.path.startswith("/releases/") else parts.path)
+                delay = server.latency + (server._rng.random() * server.jitter if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if not allowed:
+                    return self._send(429, {"message": "You are making requests too quickly."}, used)
+                if parts.path == "/database/search":
+                    return self._send(200, server._search(parse_qs(parts.query)), used)
+                match = re.fullmatch(r"/releases/(\d+)", parts.path)
+                if match and int(match.group(1)) in server.releases:
+                    release = dict(server.releases[int(match.group(1))])
+                    release["resource_url"] = f"{server.url}/releases/{release['id']}"
+                    etag = '"%s"' % hashlib.md5(json.dumps(release, sort_keys=True).encode("utf-8")).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        with server._lock:
+                            server.not_modified += 1
+                        return self._send(304, None, used, etag)
+                    return self._send(200, release, used, etag)
+                return self._send(404, {"message": "The requested resource was not found."}, used)
+
+            def _send(self, status, body, used, etag=None):
+                payload = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if payload and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    payload = gzip.compress(payload)
+                    self.send_header("Content-Encoding", "gzip")
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("X-Discogs-Ratelimit", str(server.rate_limit))
+                self.send_header("X-Discogs-Ratelimit-Used", str(used))
+                self.send_header("X-Discogs-Ratelimit-Remaining", str(max(server.rate_limit - used, 0)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake Discogs API server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--releases", type=int, default=200)
+    args = parser.parse_args(argv)
+    server = FakeDiscogsServer(make_catalog(args.releases), latency=args.latency, jitter=args.jitter,
+                               rate_limit=args.rate_limit, error_rate=args.error_rate, port=args.port)
+    print(f"Serving {len(server.releases)} releases on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
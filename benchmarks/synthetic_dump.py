@@ -0,0 +1,55 @@
+# synthetic_dump.py
+"""
+Writes a synthetic catalog (see synthetic_library.make_catalog) as a Discogs
+releases data dump, so the local index (discogs_dump.py) can be built and
+benchmarked without downloading the real dump.
+"""
+import gzip
+import xml.etree.ElementTree as ET
+
+
+def _add_text(parent, tag, text):
+    ET.SubElement(parent, tag).text = str(text)
+
+
+def release_element(release):
+    """Returns the <release> element of the dump for a release dictionary (API shape)."""
+    elem = ET.Element("release", id=str(release["id"]), status="Accepted")
+    artists = ET.SubElement(elem, "artists")
+    for artist in release["artists"]:
+        node = ET.SubElement(artists, "artist")
+        _add_text(node, "id", artist["id"])
+        _add_text(node, "name", artist["name"])
+    _add_text(elem, "title", release["title"])
+    labels = ET.SubElement(elem, "labels")
+    for label in release["labels"]:
+        ET.SubElement(labels, "label", name=label["name"], catno=label["catno"], id=str(label["id"]))
+    if release.get("country"):
+        _add_text(elem, "country", release["country"])
+    if release.get("year"):
+        _add_text(elem, "released", f"{release['year']}-00-00")
+    for tag, item_tag in (("genres", "genre"), ("styles", "style")):
+        if release.get(tag):
+            parent = ET.SubElement(elem, tag)
+            for value in release[tag]:
+                _add_text(parent, item_tag, value)
+    tracklist = ET.SubElement(elem, "tracklist")
+    for track in release["tracklist"]:
+        node = ET.SubElement(tracklist, "track")
+        _add_text(node, "position", track["position"])
+        _add_text(node, "title", track["title"])
+    return elem
+
+
+def write_dump(path, catalog):
+    """
+    Writes catalog to path (gzip-compressed if it ends in .gz) in the format of
+    discogs_YYYYMMDD_releases.xml.gz, one release at a time.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as stream:
+        stream.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<releases>\n')
+        for release in catalog:
+            stream.write(ET.tostring(release_element(release), encoding="utf-8"))
+            stream.write(b"\n")
+        stream.write(b"</releases>\n")
@@ -0,0 +1,233 @@
+# synthetic_library.py
+"""
+Generates a synthetic Discogs catalog and a library of small audio files that
+reference it, for benchmarking. The files have valid containers and tags but
+(almost) no audio, so thousands of them can be created in seconds.
+"""
+import os
+import random
+import struct
+
+from mutagen.aiff import AIFF
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3, TALB, TIT2, TPE1, TPE2, TPUB, TRCK, TXXX
+from mutagen.mp4 import MP4
+from mutagen.wave import WAVE
+
+EXTENSIONS = (".mp3", ".flac", ".wav", ".m4a", ".aiff")
+
+# Filename patterns of the kind found in real download folders.
+FILENAME_PATTERNS = (
+    "{artist} - {title}",
+    "{number:02d} {artist} - {title}",
+    "{artist} - {album} - {number:02d} {title}",
+    "{title}",
+    "{number:02d} - {artist} - {title} ({label} {catno})",
+    "[{catno}] {artist} - {title}",
+)
+
+_WORDS = (
+    "night drive noir lights out deep space echo city river dawn velvet signal pulse orbit "
+    "mirror shadow garden fever static ocean glass motion silver drift haze ember tide "
+    "neon forest circuit horizon spiral quartz harbor lunar amber cascade prism"
+).split()
+
+
+def _phrase(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).title()
+
+
+def make_catalog(releases=200, seed=1):
+    """
+    Returns a list of release dictionaries in the shape of the Discogs API
+    (/releases/<id>). Deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    labels = [(9000 + n, f"{_phrase(rng, 1)} Records {n}") for n in range(max(releases // 10, 1))]
+    catalog = []
+    for n in range(releases):
+        label_id, label = rng.choice(labels)
+        artist = f"{_phrase(rng, 2)} {n}"
+        tracks = rng.randint(1, 8)
+        catalog.append({
+            "id": 100000 + n,
+            "title": f"{_phrase(rng, rng.randint(1, 3))} EP",
+            "year": rng.randint(1990, 2024),
+            "artists": [{"id": 500000 + n, "name": artist}],
+            "labels": [{"id": label_id, "name": label, "catno": f"{label[:3].upper()}{n:04d}"}],
+            "tracklist": [
+                {"position": f"{'AB'[t % 2]}{t // 2 + 1}", "title": _phrase(rng, rng.randint(1, 3))}
+                for t in range(tracks)
+            ],
+        })
+    return catalog
+
+
+# Every writer gets `noise`, the file's own random audio data, so that no two
+# generated files are byte-identical unless they are meant to be duplicates.
+NOISE_SIZE = 4096
+
+
+def _write_mp3(path, tags, noise):
+    with open(path, "wb") as f:
+        f.write(b"\xff\xfb\x90\x00" + noise[:413])  # One MPEG frame.
+    id3 = ID3()
+    _add_id3(id3, tags)
+    id3.save(path)
+
+
+def _add_id3(id3, tags):
+    frames = {"artist": TPE1, "title": TIT2, "album": TALB, "albumartist": TPE2, "label": TPUB}
+    for key, frame in frames.items():
+        if tags.get(key):
+            id3.add(frame(encoding=3, text=tags[key]))
+    if tags.get("tracknumber"):
+        id3.add(TRCK(encoding=3, text=f"{tags['tracknumber']}/{tags['tracktotal']}"))
+    if tags.get("catno"):
+        id3.add(TXXX(encoding=3, desc="CATALOGNUMBER", text=tags["catno"]))
+
+
+def _write_flac(path, tags, noise):
+    # STREAMINFO: block sizes, frame sizes, 44.1 kHz / 2 channels / 16 bit, 0 samples, no MD5.
+    info = struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+    info += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, "big") + b"\x00" * 16
+    # There are no audio frames; the noise goes into a (last) APPLICATION block.
+    application = b"SYNT" + noise
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + bytes([0x00]) + len(info).to_bytes(3, "big") + info
+                + bytes([0x82]) + len(application).to_bytes(3, "big") + application)
+    audio = FLAC(path)
+    for key in ("artist", "title", "album", "albumartist", "label"):
+        if tags.get(key):
+            audio[key] = tags[key]
+    if tags.get("tracknumber"):
+        audio["tracknumber"] = str(tags["tracknumber"])
+        audio["tracktotal"] = str(tags["tracktotal"])
+    if tags.get("catno"):
+        audio["catalognumber"] = tags["catno"]
+    audio.save()
+
+
+def _write_wav(path, tags, noise):
+    fmt = struct.pack("<HHIIHH", 1, 2, 44100, 44100 * 4, 4, 16)
+    data = noise
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+    audio = WAVE(path)
+    audio.add_tags()
+    _add_id3(audio.tags, tags)
+    audio.save()
+
+
+def _write_aiff(path, tags, noise):
+    # COMM: 2 channels, 1024 frames, 16 bit, 44100 Hz as an 80-bit extended float.
+    comm = struct.pack(">hIh", 2, 1024, 16) + bytes.fromhex("400EAC44000000000000")
+    data = struct.pack(">II", 0, 0) + noise
+    body = b"AIFF" + b"COMM" + struct.pack(">I", len(comm)) + comm + b"SSND" + struct.pack(">I", len(data)) + data
+    with open(path, "wb") as f:
+        f.write(b"FORM" + struct.pack(">I", len(body)) + body)
+    audio = AIFF(path)
+    audio.add_tags()
+    _add_id3(audio.tags, tags)
+    audio.save()
+
+
+def _atom(name, payload):
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+
+def _write_m4a(path, tags, noise):
+    ftyp = _atom(b"ftyp", b"M4A \x00\x00\x00\x00M4A mp42isom")
+    mvhd = _atom(b"mvhd", b"\x00" * 4 + struct.pack(">IIII", 0, 0, 44100, 0) + b"\x00" * 80)
+    with open(path, "wb") as f:
+        f.write(ftyp + _atom(b"moov", mvhd) + _atom(b"mdat", noise))
+    audio = MP4(path)
+    audio.add_tags()
+    atoms = {"artist": "\xa9ART", "title": "\xa9nam", "album": "\xa9alb", "albumartist": "aART"}
+    for key, atom in atoms.items():
+        if tags.get(key):
+            audio[atom] = [tags[key]]
+    if tags.get("tracknumber"):
+        audio["trkn"] = [(tags["tracknumber"], tags["tracktotal"])]
+    if tags.get("label"):
+        audio["----:com.apple.iTunes:LABEL"] = [tags["label"].encode("utf-8")]
+    if tags.get("catno"):
+        audio["----:com.apple.iTunes:CATALOGNUMBER"] = [tags["catno"].encode("utf-8")]
+    audio.save()
+
+
+WRITERS = {
+    ".mp3": _write_mp3,
+    ".flac": _write_flac,
+    ".wav": _write_wav,
+    ".aiff": _write_aiff,
+    ".m4a": _write_m4a,
+}
+
+
+def generate_library(folder, catalog, files=500, extensions=EXTENSIONS, tagged=0.5,
+                     patterns=FILENAME_PATTERNS, duplicates=0.05, unknown=0.05, subfolders=10, seed=1):
+    """
+    Writes `files` audio files below folder and returns their paths.
+
+    Parameters:
+      - catalog: Releases from make_catalog; every file is a track of one of them.
+      - extensions: File types to create, chosen round-robin.
+      - tagged: Fraction of files that carry full tags (the others rely on their names).
+      - patterns: Filename patterns, chosen at random.
+      - duplicates: Fraction of files that are byte-identical copies of an earlier file.
+      - unknown: Fraction of files that match nothing in the catalog.
+      - subfolders: Number of subfolders the files are spread over.
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for n in range(files):
+        directory = os.path.join(folder, f"Import {n % subfolders:02d}") if subfolders else folder
+        os.makedirs(directory, exist_ok=True)
+        extension = extensions[n % len(extensions)]
+        if paths and rng.random() < duplicates:
+            source = rng.choice(paths)
+            stem = os.path.splitext(os.path.basename(source))[0]
+            path = os.path.join(directory, f"{stem} (1){os.path.splitext(source)[1]}")
+            with open(source, "rb") as src, open(path, "wb") as dst:
+                dst.write(src.read())
+            paths.append(path)
+            continue
+
+        release = rng.choice(catalog)
+        number = rng.randrange(len(release["tracklist"]))
+        fields = {
+            "artist": release["artists"][0]["name"],
+            "title": release["tracklist"][number]["title"],
+            "album": release["title"],
+            "number": number + 1,
+            "label": release["labels"][0]["name"],
+            "catno": release["labels"][0]["catno"],
+        }
+        matchable = rng.random() >= unknown
+        if not matchable:
+            fields.update(artist=f"Unknown Artist {n}", title=f"Unreleased Demo {n}", album=f"Demos {n}",
+                          label="White Label", catno=f"WHITE{n:03d}")
+        tags = {}
+        if rng.random() < tagged:
+            tags = {
+                "artist": fields["artist"],
+                "title": fields["title"],
+                "album": fields["album"],
+                "albumartist": fields["artist"],
+                "tracknumber": number + 1,
+                "tracktotal": len(release["tracklist"]),
+                "label": release["labels"][0]["name"] if matchable else None,
+                "catno": release["labels"][0]["catno"] if matchable else None,
+            }
+        name = rng.choice(patterns).format(**fields)
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            path = os.path.join(directory, f"{name} [{n}]{extension}")
+        # A generator of its own, so the noise does not change the choices above.
+        noise = random.Random(f"{seed}-{n}").randbytes(NOISE_SIZE)
+        WRITERS[extension](path, tags, noise)
+        paths.append(path)
+    return paths
@@ -0,0 +1,224 @@
+# catalog.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from discogs_cache import DEFAULT_CACHE_DIR
+from file_ops import FileOps
+from journal import file_identity
+from scanner import OUTPUT_MARKER, mark_output_dir
+
+DEFAULT_CATALOG_PATH = os.path.join(DEFAULT_CACHE_DIR, "catalog.sqlite3")
+
+# Folder of an organized file below the organized folder; the fields are those of
+# the release info (see discogs_utils.lookup_release), e.g. {Genre} or {Release ID}.
+DEFAULT_LAYOUT = "{Label}/{Catalog Number} - {Artist} - {Title} - {Year}"
+
+RELAYOUT_ACTIONS = ("move", "link", "copy")
+
+
+class _Fields(dict):
+    def __missing__(self, key):
+        return "Unknown"
+
+
+def _field_value(value):
+    value = str(value).replace("/", "-").replace(os.sep, "-").strip()
+    # "", "." and ".." would drop a folder level or climb out of the organized folder.
+    return value if value.strip(".") else "Unknown"
+
+
+def format_layout(layout, release_info):
+    """
+    Returns the folder (relative to the organized folder) for a file of the given
+    release. Path separators inside field values are replaced, so a label such as
+    "Rough/Trade" stays a single folder; empty values become "Unknown".
+
+    Raises ValueError if the layout does not lead to a folder below the organized
+    folder (e.g. "../{Label}" or "/{Label}").
+    """
+    fields = _Fields({key: _field_value(value) for key, value in release_info.items()})
+    path = os.path.normpath(layout.format_map(fields))
+    if os.path.isabs(path) or path == os.curdir or path.split(os.sep)[0] == os.pardir:
+        raise ValueError(f"Layout {layout!r} does not lead to a folder below the organized folder")
+    return path
+
+
+class Catalog:
+    """
+    Index of organized files: for every file it records the Discogs release it was
+    matched to (ID, match score and all release fields), so that questions such as
+    "which files belong to release X" and re-layouts of the tree are answered
+    locally, without asking Discogs again.
+
+    Parameters:
+      - path: Location of the SQLite database (created if missing).
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " release_id INTEGER,"
+            " score REAL,"
+            " release TEXT NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_release ON files (release_id)")
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def record(self, path, release_info):
+        """Records an organized file and the release it was matched to."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, release_id, score, release, updated) VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(path), release_info.get("Release ID"), release_info.get("Score"),
+                 json.dumps(release_info), time.time()),
+            )
+            self._conn.commit()
+
+    def move(self, old_path, new_path):
+        """Updates the entry of a file that was moved to new_path."""
+        with self._lock:
+            self._conn.execute("UPDATE files SET path = ?, updated = ? WHERE path = ?",
+                               (os.path.abspath(new_path), time.time(), os.path.abspath(old_path)))
+            self._conn.commit()
+
+    def forget(self, path):
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+            self._conn.commit()
+
+    def files(self, release_id):
+        """Returns the paths of the files matched to a release."""
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM files WHERE release_id = ? ORDER BY path",
+                                      (release_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def entries(self, folder):
+        """Returns (path, release_info) of every file below folder, in path order."""
+        prefix = os.path.join(os.path.abspath(folder), "")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, release FROM files WHERE substr(path, 1, ?) = ? ORDER BY path",
+                (len(prefix), prefix),
+            ).fetchall()
+        return [(path, json.loads(release)) for path, release in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _remove_empty_dirs(directory, root):
+    # Removes directory and its parents up to (not including) root while they are empty
+    # (apart from an output marker).
+    while directory != root and directory.startswith(root):
+        try:
+            if os.listdir(directory) == [OUTPUT_MARKER]:
+                os.remove(os.path.join(directory, OUTPUT_MARKER))
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def relayout(catalog, folder, layout, action="move", journal=None, dry_run=False, log_callback=None):
+    """
+    Rearranges the organized files below folder into a new layout, using only the
+    releases recorded in the catalog (no tags are read and Discogs is not asked).
+
+    Parameters:
+      - catalog: The Catalog the files were recorded in when they were organized.
+      - folder: The organized folder.
+      - layout: The new folder template, e.g. "{Genre}/{Label}/{Year} - {Title}".
+      - action: "move" the files, or "link"/"copy" them into the new layout
+                (hard links, or copies where a link is not possible; the existing
+                tree is kept and both are cataloged).
+      - journal: (Optional) Journal to update, so that moved files stay known as
+                 organized output when the folder is organized again.
+      - dry_run: (Optional) Only report where each file would go.
+      - log_callback: (Optional) A function that receives log messages.
+
+    Returns a dictionary with the number of files per outcome ("moved", "linked",
+    "copied", "planned", "unchanged", "missing", "conflict").
+    """
+    def log(msg):
+        if log_callback:
+            log_callback(msg)
+        else:
+            print(msg)
+
+    if action not in RELAYOUT_ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    format_layout(layout, {})  # Raises ValueError for a layout that leads out of folder.
+    folder = os.path.abspath(folder)
+    file_ops = FileOps()
+    seen_tops = set()
+    counts = dict.fromkeys(("moved", "linked", "copied", "planned", "unchanged", "missing", "conflict"), 0)
+
+    for path, release_info in catalog.entries(folder):
+        dest = os.path.join(folder, format_layout(layout, release_info), os.path.basename(path))
+        if dest == path:
+            counts["unchanged"] += 1
+            continue
+        if not os.path.exists(path):
+            counts["missing"] += 1
+            continue
+        if os.path.exists(dest):
+            log(f"Already exists, left in place: {os.path.relpath(dest, folder)}")
+            counts["conflict"] += 1
+            continue
+        if dry_run:
+            log(f"Would {action}: {os.path.relpath(path, folder)} -> {os.path.relpath(dest, folder)}")
+            counts["planned"] += 1
+            continue
+
+        top = os.path.join(folder, os.path.relpath(dest, folder).split(os.sep)[0])
+        if top not in seen_tops:
+            seen_tops.add(top)
+            # A new folder is skipped when the folder is scanned again; an existing one
+            # may hold files still to be organized and is left as it is.
+            if not os.path.isdir(top):
+                mark_output_dir(top)
+
+        if action == "move":
+            file_ops.move(path, dest)
+            catalog.move(path, dest)
+            if journal is not None:
+                journal.record_moved(path, dest, file_identity(os.stat(dest)))
+            _remove_empty_dirs(os.path.dirname(path), folder)
+            counts["moved"] += 1
+        else:
+            if action == "link":
+                file_ops.ensure_dir(os.path.dirname(dest))
+                try:
+                    os.link(path, dest)
+                    counts["linked"] += 1
+                except OSError as e:
+                    # E.g. the new folder is on another file system; copy instead.
+                    log(f"Cannot link {os.path.relpath(path, folder)} ({e.strerror}); copying it")
+                    file_ops.copy(path, dest)
+                    counts["copied"] += 1
+            else:
+                file_ops.copy(path, dest)
+                counts["copied"] += 1
+            catalog.record(dest, release_info)
+            if journal is not None:
+                journal.record_output(dest, file_identity(os.stat(dest)))
+
+    log(", ".join(f"{name}: {count}" for name, count in counts.items() if count))
+    return counts
@@ -0,0 +1,431 @@
+# cli.py
+"""
+Command-line entry point for running the organizer without the GUI (servers,
+cron jobs, ingest workers). Never imports tkinter.
+
+Usage:
+    python cli.py organize FOLDER [--action move|copy] [--dry-run] [--json] [--offline]
+    python cli.py watch FOLDER [--action move|copy] [--scan-existing]
+    python cli.py queue FOLDER                 # fill the shared work queue
+    python cli.py worker FOLDER [--token-file FILE] [--worker NAME]
+    python cli.py relayout FOLDER --layout "{Genre}/{Label}/{Year} - {Title}" [--dry-run]
+    python cli.py catalog --release ID
+
+The Discogs token is read from the DISCOGS_TOKEN environment variable, or from
+--token-file (default: ~/.musicorganizer/token).
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+# Only the standard library is imported at module level: the organizer and its
+# dependencies are loaded by the command that needs them, so --help and argument
+# errors return immediately, and the tag reader's worker processes (which
+# re-import this module) start fast.
+_STARTED = time.perf_counter()
+
+DEFAULT_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".musicorganizer", "token")
+# Same as catalog.DEFAULT_LAYOUT, repeated here to keep --help free of imports.
+DEFAULT_LAYOUT = "{Label}/{Catalog Number} - {Artist} - {Title} - {Year}"
+
+
+def read_token(token_file=None):
+    """Returns the Discogs token from DISCOGS_TOKEN or the token file, or None."""
+    token = os.environ.get("DISCOGS_TOKEN", "").strip()
+    if token:
+        return token
+    path = token_file or DEFAULT_TOKEN_FILE
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        if token_file:
+            raise
+        return None
+
+
+class Output:
+    """
+    Writes log messages and per-file results. In JSON mode every result (and the
+    final summary) is one JSON object per line on stdout and log messages go to
+    stderr; otherwise log messages go to stdout and results are not printed.
+    """
+
+    def __init__(self, json_lines=False, quiet=False):
+        self.json_lines = json_lines
+        self.quiet = quiet
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        if self.quiet:
+            return
+        with self._lock:
+            print(message, file=sys.stderr if self.json_lines else sys.stdout, flush=True)
+
+    def result(self, result):
+        if self.json_lines:
+            self._write(result)
+
+    def summary(self, summary):
+        if self.json_lines:
+            self._write({"summary": summary})
+        else:
+            for key, value in summary.items():
+                self.log(f"{key}: {value}")
+
+    def _write(self, obj):
+        line = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+
+def add_client_arguments(parser):
+    """Arguments shared by the commands that talk to Discogs."""
+    parser.add_argument("--token-file", help=f"File containing the Discogs token (default: {DEFAULT_TOKEN_FILE})")
+    parser.add_argument("--offline", action="store_true", help="Only use cached Discogs data; no API requests.")
+    parser.add_argument("--no-index", action="store_true", help="Do not use the local Discogs data dump index.")
+
+
+def add_queue_arguments(parser):
+    """Arguments shared by the commands that use the work queue."""
+    parser.add_argument("--queue", help="Queue database (default: .musicorganizer-queue.sqlite3 in the folder).")
+    parser.add_argument("--no-wal", action="store_true",
+                        help="Use rollback journaling, required when workers on several hosts share the queue.")
+
+
+def add_catalog_arguments(parser, layout=True, write_tags=False):
+    """Arguments shared by the commands that write or read the catalog of organized files."""
+    if layout:
+        parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                            help=f'Folder template of matched files, from release fields (default: "{DEFAULT_LAYOUT}").')
+    if write_tags:
+        parser.add_argument("--write-tags", action="store_true",
+                            help="Store the Discogs release ID and track position in the tags of organized files, "
+                                 "so they are never searched for again.")
+    parser.add_argument("--catalog", help="Catalog database (default: ~/.musicorganizer/catalog.sqlite3).")
+
+
+def open_catalog(args):
+    from catalog import Catalog, DEFAULT_CATALOG_PATH
+
+    return Catalog(args.catalog or DEFAULT_CATALOG_PATH)
+
+
+def open_client(args, output):
+    """
+    Creates the Discogs client with its cache and rate limiter, and opens the local
+    index if one exists. Returns (client, cache, limiter, local_index).
+    """
+    from discogs_cache import DiscogsCache
+    from discogs_dump import LocalIndex, DEFAULT_INDEX_PATH
+    from discogs_utils import create_discogs_client
+    from rate_limiter import RateLimiter
+
+    token = read_token(args.token_file)
+    if not token and not args.offline:
+        raise SystemExit("No Discogs token: set DISCOGS_TOKEN or use --token-file.")
+    cache = DiscogsCache(offline=args.offline)
+    limiter = RateLimiter()
+    client = create_discogs_client(token, cache=cache, limiter=limiter)
+    local_index = None
+    if not args.no_index and os.path.exists(DEFAULT_INDEX_PATH):
+        local_index = LocalIndex(DEFAULT_INDEX_PATH)
+        output.log(f"Using local Discogs index ({len(local_index)} releases)")
+    return client, cache, limiter, local_index
+
+
+def cmd_organize(args, output):
+    import organizer
+    from instrumentation import Metrics
+    from journal import Journal, DEFAULT_JOURNAL_PATH
+
+    client, cache, limiter, local_index = open_client(args, output)
+    journal = None if args.no_journal or args.dry_run else Journal(args.journal or DEFAULT_JOURNAL_PATH)
+    catalog = None if args.dry_run else open_catalog(args)
+    startup = time.perf_counter() - _STARTED
+    output.log(f"Ready in {startup * 1000:.0f} ms")
+
+    counts = {}
+    metrics = Metrics() if args.metrics or args.prometheus or output.json_lines else None
+
+    def on_result(result):
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        output.result(result)
+
+    started = time.perf_counter()
+    try:
+        organizer.organize_files(
+            client, args.folder, args.action,
+            log_callback=output.log,
+            result_callback=on_result,
+            local_index=local_index,
+            journal=journal,
+            duplicates=None if args.duplicates == "off" else args.duplicates,
+            dry_run=args.dry_run,
+            tag_workers=args.tag_workers,
+            metrics=metrics,
+            catalog=catalog,
+            layout=args.layout,
+            write_tags=args.write_tags,
+        )
+    finally:
+        if journal is not None:
+            journal.close()
+        if catalog is not None:
+            catalog.close()
+        if local_index is not None:
+            local_index.close()
+        cache.close()
+
+    if metrics is not None:
+        if args.metrics:
+            metrics.write_json(args.metrics)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+
+    output.summary({
+        "files": counts,
+        "startup_seconds": round(startup, 3),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "api_requests": limiter.requests_made,
+        "rate_limit_wait_seconds": round(limiter.time_slept, 1),
+        "cache_hits": cache.hits,
+        "cache_misses": cache.misses,
+        **({"metrics": metrics.summary()} if metrics is not None and output.json_lines else {}),
+    })
+    return 1 if counts.get("error") else 0
+
+
+def cmd_watch(args, output):
+    from journal import Journal, DEFAULT_JOURNAL_PATH
+    from watcher import watch_folder
+
+    client, cache, limiter, local_index = open_client(args, output)
+    journal = None if args.no_journal else Journal(args.journal or DEFAULT_JOURNAL_PATH)
+    catalog = open_catalog(args)
+    stop = threading.Event()
+
+    def on_signal(signum, frame):
+        output.log("Stopping...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    try:
+        watch_folder(
+            client, args.folder, args.action, stop,
+            log_callback=output.log,
+            result_callback=output.result,
+            quiet_seconds=args.quiet_seconds,
+            poll_interval=args.poll_interval,
+            scan_existing=args.scan_existing,
+            local_index=local_index,
+            journal=journal,
+            duplicates=None if args.duplicates == "off" else args.duplicates,
+            catalog=catalog,
+            layout=args.layout,
+            write_tags=args.write_tags,
+        )
+    finally:
+        catalog.close()
+        if journal is not None:
+            journal.close()
+        if local_index is not None:
+            local_index.close()
+        cache.close()
+    return 0
+
+
+def cmd_relayout(args, output):
+    from catalog import relayout
+    from journal import Journal, DEFAULT_JOURNAL_PATH
+
+    catalog = open_catalog(args)
+    journal = None if args.no_journal or args.dry_run else Journal(args.journal or DEFAULT_JOURNAL_PATH)
+    started = time.perf_counter()
+    try:
+        counts = relayout(catalog, args.folder, args.layout, action=args.action, journal=journal,
+                          dry_run=args.dry_run, log_callback=output.log)
+    finally:
+        catalog.close()
+        if journal is not None:
+            journal.close()
+    output.summary({"files": counts, "elapsed_seconds": round(time.perf_counter() - started, 3)})
+    return 0
+
+
+def cmd_catalog(args, output):
+    catalog = open_catalog(args)
+    try:
+        paths = catalog.files(args.release)
+    finally:
+        catalog.close()
+    for path in paths:
+        if output.json_lines:
+            output.result({"path": path, "release_id": args.release})
+        else:
+            print(path)
+    return 0 if paths else 1
+
+
+def open_queue(args):
+    from task_queue import TaskQueue, default_queue_path
+
+    return TaskQueue(args.queue or default_queue_path(args.folder), wal=not args.no_wal)
+
+
+def cmd_queue(args, output):
+    queue = open_queue(args)
+    try:
+        added = 0 if args.status else queue.fill(args.folder)
+        counts = queue.counts()
+    finally:
+        queue.close()
+    output.summary({"added": added, "tasks": counts})
+    return 0
+
+
+def cmd_worker(args, output):
+    import socket
+    from task_queue import run_worker
+
+    queue = open_queue(args)
+    client, cache, limiter, local_index = open_client(args, output)
+    catalog = open_catalog(args)
+    worker = args.worker or f"{socket.gethostname()}-{os.getpid()}"
+    stop = threading.Event()
+
+    def on_signal(signum, frame):
+        output.log("Stopping after the current batch...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    started = time.perf_counter()
+    try:
+        processed = run_worker(
+            queue, client, args.folder, args.action, worker, stop,
+            batch_size=args.batch,
+            lease_seconds=args.lease_seconds,
+            log_callback=output.log,
+            result_callback=output.result,
+            local_index=local_index,
+            duplicates=None if args.duplicates == "off" else args.duplicates,
+            tag_workers=args.tag_workers,
+            catalog=catalog,
+            layout=args.layout,
+            write_tags=args.write_tags,
+        )
+    finally:
+        queue.close()
+        catalog.close()
+        if local_index is not None:
+            local_index.close()
+        cache.close()
+    output.summary({
+        "worker": worker,
+        "processed": processed,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "api_requests": limiter.requests_made,
+        "rate_limit_wait_seconds": round(limiter.time_slept, 1),
+    })
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="music-organizer", description="Organize music files by their Discogs release.")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per file (and a summary) on stdout.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print log messages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    organize = subparsers.add_parser("organize", help="Move or copy the audio files of a folder into Label/Release folders.")
+    organize.add_argument("folder", help="Folder with the music files.")
+    organize.add_argument("--action", choices=("move", "copy"), default="move")
+    organize.add_argument("--dry-run", action="store_true", help="Look everything up but do not touch any file.")
+    organize.add_argument("--duplicates", choices=("folder", "hardlink", "skip", "off"), default="folder",
+                          help="What to do with files identical to one seen earlier (default: folder).")
+    organize.add_argument("--journal", help="Journal database (default: ~/.musicorganizer/journal.sqlite3).")
+    organize.add_argument("--no-journal", action="store_true", help="Do not record or resume runs.")
+    organize.add_argument("--tag-workers", type=int, help="Processes reading tags (default: one per CPU).")
+    organize.add_argument("--metrics", help="Write timings and counters of the run to this JSON file.")
+    organize.add_argument("--prometheus", help="Write the metrics to this Prometheus textfile (e.g. for node_exporter).")
+    add_catalog_arguments(organize, write_tags=True)
+    add_client_arguments(organize)
+    organize.set_defaults(func=cmd_organize)
+
+    watch = subparsers.add_parser("watch", help="Keep running and organize audio files as they are added to a folder.")
+    watch.add_argument("folder", help="Folder to watch.")
+    watch.add_argument("--action", choices=("move", "copy"), default="move")
+    watch.add_argument("--scan-existing", action="store_true", help="Organize the files already in the folder first.")
+    watch.add_argument("--quiet-seconds", type=float, default=2.0,
+                       help="Wait until a file has not changed for this long (default: 2).")
+    watch.add_argument("--poll-interval", type=float, default=5.0,
+                       help="Seconds between scans where inotify is not available (default: 5).")
+    watch.add_argument("--duplicates", choices=("folder", "hardlink", "skip", "off"), default="folder",
+                       help="What to do with files identical to one seen earlier (default: folder).")
+    watch.add_argument("--journal", help="Journal database (default: ~/.musicorganizer/journal.sqlite3).")
+    watch.add_argument("--no-journal", action="store_true", help="Do not record organized files.")
+    add_catalog_arguments(watch, write_tags=True)
+    add_client_arguments(watch)
+    watch.set_defaults(func=cmd_watch)
+
+    queue = subparsers.add_parser("queue", help="Add the audio files of a folder to the work queue shared by workers.")
+    queue.add_argument("folder", help="Folder with the music files (on storage every worker can reach).")
+    queue.add_argument("--status", action="store_true", help="Only print the number of tasks per state.")
+    add_queue_arguments(queue)
+    queue.set_defaults(func=cmd_queue)
+
+    worker = subparsers.add_parser("worker", help="Organize files from the shared work queue; run one per Discogs token.")
+    worker.add_argument("folder", help="The folder that was queued.")
+    worker.add_argument("--action", choices=("move", "copy"), default="move")
+    worker.add_argument("--worker", help="Name of this worker (default: host name and process id).")
+    worker.add_argument("--batch", type=int, default=50, help="Files leased at a time (default: 50).")
+    worker.add_argument("--lease-seconds", type=float, default=300,
+                        help="A crashed worker's files are handed out again after this long (default: 300).")
+    worker.add_argument("--duplicates", choices=("folder", "hardlink", "skip", "off"), default="folder",
+                        help="What to do with identical files within a batch (default: folder).")
+    worker.add_argument("--tag-workers", type=int, default=0, help="Processes reading tags (default: 0, in-thread).")
+    add_queue_arguments(worker)
+    add_catalog_arguments(worker, write_tags=True)
+    add_client_arguments(worker)
+    worker.set_defaults(func=cmd_worker)
+
+    relayout = subparsers.add_parser("relayout", help="Rearrange organized files into a new folder layout, "
+                                                      "from the catalog only (no Discogs requests).")
+    relayout.add_argument("folder", help="The organized folder.")
+    relayout.add_argument("--action", choices=("move", "link", "copy"), default="move",
+                          help="Move the files, or hard-link/copy them into the new layout (default: move).")
+    relayout.add_argument("--dry-run", action="store_true", help="Only show where each file would go.")
+    relayout.add_argument("--journal", help="Journal database to keep up to date (default: ~/.musicorganizer/journal.sqlite3).")
+    relayout.add_argument("--no-journal", action="store_true", help="Do not update the journal.")
+    add_catalog_arguments(relayout)
+    relayout.set_defaults(func=cmd_relayout)
+
+    catalog = subparsers.add_parser("catalog", help="List the organized files of a Discogs release.")
+    catalog.add_argument("--release", type=int, required=True, help="Discogs release ID.")
+    add_catalog_arguments(catalog, layout=False)
+    catalog.set_defaults(func=cmd_catalog)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    output = Output(json_lines=args.json, quiet=args.quiet)
+    if getattr(args, "folder", None) is not None and not os.path.isdir(args.folder):
+        raise SystemExit(f"Not a folder: {args.folder}")
+    if getattr(args, "layout", None) is not None:
+        from catalog import format_layout
+        try:
+            format_layout(args.layout, {})
+        except ValueError as e:
+            raise SystemExit(str(e))
+    return args.func(args, output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# dedup.py
+import hashlib
+import mmap
+import os
+import threading
+from grouping import DIRECTORY_DONE
+
+# Policies for confirmed duplicates:
+#   skip     - leave the duplicate where it is
+#   hardlink - place it next to the original's destination as a hard link (no data copied)
+#   folder   - move/copy it into the "Duplicates" folder
+DUPLICATE_POLICIES = ("skip", "hardlink", "folder")
+DUPLICATES_FOLDER = "Duplicates"
+
+PARTIAL_HASH_BYTES = 16 * 1024
+FULL_HASH_CHUNK = 1024 * 1024
+
+
+def partial_hash(path, size, block=PARTIAL_HASH_BYTES):
+    """Hash of the first and last `block` bytes of a file (the whole file if it is smaller)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(block))
+        if size > 2 * block:
+            f.seek(size - block)
+            digest.update(f.read(block))
+        elif size > block:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def full_hash(path, chunk=FULL_HASH_CHUNK):
+    """Hash of the whole file, streamed chunk by chunk from a memory map."""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.digest()  # Empty files cannot be mapped.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, len(mapped), chunk):
+                digest.update(mapped[offset:offset + chunk])
+    return digest.digest()
+
+
+class Deduplicator:
+    """
+    Pipeline stage that recognizes files with identical content before they are
+    looked up, so every copy after the first reuses the first copy's match.
+
+    Candidates are narrowed down in tiers, each one only for files that collided
+    in the one before: file size, then a hash of the first and last few KB, then
+    a full streaming hash. A file with a size seen for the first time is never read.
+
+    Originals are passed on unchanged. Duplicates are held back until resolve() is
+    called with the original's decision and are then emitted with the same
+    "release_info", with "duplicate_of" set to the original's record and "dest" left
+    for the file stage to choose according to the duplicate policy.
+
+    Only a small record of every original is kept for the whole run: its path and
+    size, and once it is decided its "dest", "release_info" and "placed" event.
+
+    Parameters:
+      - by_directory: Hold the files of each directory until its DIRECTORY_DONE
+                      marker arrives (markers carry the directory's "index" in scan
+                      order) and check them in scan order, shortest path first. The
+                      original of a set of copies is then the same in every run,
+                      e.g. "Track.flac" rather than "Track (1).flac".
+    """
+
+    def __init__(self, by_directory=False):
+        self.by_directory = by_directory
+        self._by_size = {}
+        self._records = {}
+        self._hashes = {}
+        self._waiting = {}
+        self._batches = {}
+        self._finished = {}
+        self._next_index = 0
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def add(self, item, emit):
+        if DIRECTORY_DONE in item:
+            self._directory_done(item, emit)
+            return
+        if "dest" in item:
+            emit(item)  # Already decided (e.g. replayed from the journal).
+            return
+        if self.by_directory:
+            with self._lock:
+                self._batches.setdefault(os.path.dirname(item["path"]), []).append(item)
+            return
+        self._check(item, emit)
+
+    def flush(self, emit):
+        # Normally empty: every directory of the scan ends with its marker.
+        with self._lock:
+            markers = [self._finished.pop(index) for index in sorted(self._finished)]
+            batches = [self._batches.pop(marker[DIRECTORY_DONE], []) for marker in markers]
+            batches += [self._batches.pop(directory) for directory in sorted(self._batches)]
+        for batch in batches:
+            self._check_batch(batch, emit)
+        for marker in markers:
+            emit(marker)
+
+    def _directory_done(self, marker, emit):
+        if not self.by_directory:
+            emit(marker)  # Only for the group stage.
+            return
+        # Markers may arrive out of scan order; directories are released in order.
+        ready = []
+        with self._lock:
+            self._finished[marker["index"]] = marker
+            while self._next_index in self._finished:
+                marker = self._finished.pop(self._next_index)
+                ready.append((self._batches.pop(marker[DIRECTORY_DONE], []), marker))
+                self._next_index += 1
+        for batch, marker in ready:
+            self._check_batch(batch, emit)
+            emit(marker)  # After the directory's files, for the group stage.
+
+    def _check_batch(self, batch, emit):
+        for item in sorted(batch, key=lambda item: (len(item["path"]), item["path"])):
+            self._check(item, emit)
+
+    def _check(self, item, emit):
+        with self._lock:
+            original = self._find_original(item)
+            if original is None:
+                record = {"path": item["path"], "size": item["size"]}
+                self._by_size.setdefault(item["size"], []).append(record)
+                self._records[item["path"]] = record
+                ready = False
+            else:
+                self.duplicates += 1
+                item["duplicate_of"] = original
+                ready = "release_info" in original
+                if not ready:
+                    self._waiting.setdefault(original["path"], []).append(item)
+        if original is None:
+            emit(item)
+        elif ready:
+            emit(self._inherit(item))
+
+    def resolve(self, original):
+        """
+        Called once the original's release_info and dest are known, before it is
+        handed to the file stage. Returns its held duplicates, ready to be emitted
+        after it.
+        """
+        with self._lock:
+            record = self._records.get(original["path"])
+            if record is not None:
+                record.update(dest=original.get("dest"), release_info=original.get("release_info"),
+                              placed=original.get("placed"))
+            waiting = self._waiting.pop(original["path"], [])
+        return [self._inherit(item) for item in waiting]
+
+    @staticmethod
+    def _inherit(item):
+        item["release_info"] = item["duplicate_of"].get("release_info")
+        item["dest"] = None  # Decided; later stages pass it through to the file stage.
+        return item
+
+    def _find_original(self, item):
+        candidates = self._by_size.get(item["size"])
+        if not candidates:
+            return None
+        try:
+            partial = self._hash(item, "partial")
+            candidates = [c for c in candidates if self._hash(c, "partial") == partial]
+            if not candidates:
+                return None
+            full = self._hash(item, "full")
+            for candidate in candidates:
+                if self._hash(candidate, "full") == full:
+                    return candidate
+        except OSError:
+            pass  # Unreadable; treat as unique and let the later stages report it.
+        return None
+
+    def _hash(self, item, tier):
+        key = (item["path"], tier)
+        if key not in self._hashes:
+            try:
+                self._hashes[key] = self._hash_file(item["path"], item["size"], tier)
+            except FileNotFoundError:
+                if not item.get("dest"):
+                    raise
+                # The original has been moved. Its dest is recorded before the file stage
+                # gets it (see resolve), and a move removes the source only once dest is
+                # complete, so the same bytes are read either way.
+                self._hashes[key] = self._hash_file(item["dest"], item["size"], tier)
+        return self._hashes[key]
+
+    @staticmethod
+    def _hash_file(path, size, tier):
+        return partial_hash(path, size) if tier == "partial" else full_hash(path)
@@ -0,0 +1,259 @@
+# discogs_cache.py
+import os
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from discogs_client.fetchers import Fetcher
+import instrumentation
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".musicorganizer")
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "discogs_cache.sqlite3")
+DEFAULT_TTL = 30 * 24 * 3600           # Release data rarely changes; keep entries for a month.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # Least recently used entries are evicted above this size.
+
+OFFLINE_MESSAGE = "Not in local cache (offline mode)"
+OFFLINE_MISS = (json.dumps({"message": OFFLINE_MESSAGE}).encode("utf8"), 404)
+
+
+def is_offline_miss(error):
+    """
+    True if error (a discogs_client HTTPError) is the 404 answered by CachingFetcher
+    in offline mode for a request that is not cached.
+    """
+    return getattr(error, "status_code", None) == 404 and OFFLINE_MESSAGE in str(error)
+
+
+def normalize_query(query):
+    """
+    Normalizes a free-text search query so that trivially different spellings
+    ("Artist  Title", "artist title") share one cache entry.
+    """
+    query = unicodedata.normalize("NFKC", query or "")
+    return " ".join(query.lower().split())
+
+
+def cache_key_for_url(url):
+    """
+    Returns the cache key for a Discogs API URL, or None if the URL is not cacheable.
+
+    Search pages are keyed by their normalized query string (the "q" parameter is
+    normalized, the remaining parameters are sorted), releases by their ID.
+    """
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/")
+    if path == "/database/search":
+        params = []
+        for name, value in parse_qsl(parts.query, keep_blank_values=True):
+            if name == "token":
+                continue
+            if name == "q":
+                value = normalize_query(value)
+            params.append((name, value))
+        return "search:" + urlencode(sorted(params))
+    if path.startswith("/releases/"):
+        release_id = path[len("/releases/"):]
+        if release_id.isdigit():
+            return f"release:{release_id}"
+    return None
+
+
+class DiscogsCache:
+    """
+    Persistent SQLite cache for Discogs API responses.
+
+    Parameters:
+      - path: Location of the SQLite database (created if missing).
+      - ttl: Seconds an entry stays valid. Expired entries are treated as misses, but
+             entries with an ETag or Last-Modified validator are kept so they can be
+             revalidated with a conditional request (see get_stale).
+      - max_bytes: Upper bound for the stored payloads; least recently used entries are evicted first.
+      - offline: When True, the client never goes to the network and cache misses fail immediately.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        # Access times are buffered and written together with the next insert,
+        # so a cache hit is a single indexed read.
+        self._pending_touches = {}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        for column in ("etag", "last_modified"):
+            if column not in columns:  # Caches created before validators were stored.
+                self._conn.execute(f"ALTER TABLE entries ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        """Returns the cached payload for key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created, etag, last_modified FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created, etag, last_modified = row
+            if self.ttl is not None and now - created > self.ttl:
+                if not (etag or last_modified):
+                    self._delete(key)
+                self.misses += 1
+                return None
+            self._pending_touches[key] = now
+            self.hits += 1
+            return value
+
+    def get_stale(self, key):
+        """
+        Returns (payload, etag, last_modified) for an entry that has a validator,
+        expired or not, or None. Used to send conditional requests.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, etag, last_modified FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or not (row[1] or row[2]):
+            return None
+        return row
+
+    def revalidate(self, key):
+        """Marks an entry as fresh again after the server answered 304 Not Modified."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE entries SET created = ?, accessed = ? WHERE key = ?", (now, now, key))
+            self._conn.commit()
+            self.revalidated += 1
+
+    def put(self, key, value, etag=None, last_modified=None):
+        """Stores a payload (and its validators) under key and evicts old entries if the cache grew too large."""
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed, etag, last_modified)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now, etag, last_modified),
+            )
+            self._total_bytes += len(value)
+            self._pending_touches.pop(key, None)
+            self._flush_touches()
+            self._evict()
+            self._conn.commit()
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._pending_touches.clear()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+    def _delete(self, key):
+        row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._total_bytes -= row[0]
+            self._conn.commit()
+
+    def _flush_touches(self):
+        if self._pending_touches:
+            self._conn.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_touches.items()],
+            )
+            self._pending_touches.clear()
+
+    def _evict(self):
+        while self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows])
+            self._total_bytes -= sum(size for _, size in rows)
+
+
+class CachingFetcher(Fetcher):
+    """
+    Wraps another discogs_client fetcher and serves search pages and releases from a DiscogsCache.
+
+    Every request made by the client goes through its fetcher, so this also covers the
+    lazy release loads triggered by reading release.tracklist, release.artists, etc.
+
+    Expired entries that carry an ETag or Last-Modified validator are refreshed with
+    a conditional request if the wrapped fetcher supports fetch_with_headers; a
+    304 Not Modified answer renews the cached payload without transferring it again.
+    """
+
+    def __init__(self, fetcher, cache):
+        self.fetcher = fetcher
+        self.cache = cache
+
+    def fetch(self, client, method, url, data=None, headers=None, json=True):
+        key = cache_key_for_url(url) if method == "GET" else None
+        if key is None:
+            return self.fetcher.fetch(client, method, url, data, headers, json)
+
+        content = self.cache.get(key)
+        if content is not None:
+            instrumentation.incr("cache.hits")
+            return content, 200
+        instrumentation.incr("cache.misses")
+        if self.cache.offline:
+            return OFFLINE_MISS
+
+        if not hasattr(self.fetcher, "fetch_with_headers"):
+            content, status_code = self.fetcher.fetch(client, method, url, data, headers, json)
+            if status_code == 200:
+                self.cache.put(key, content)
+            return content, status_code
+
+        stale = self.cache.get_stale(key)
+        request_headers = dict(headers or {})
+        if stale is not None:
+            if stale[1]:
+                request_headers["If-None-Match"] = stale[1]
+            if stale[2]:
+                request_headers["If-Modified-Since"] = stale[2]
+        content, status_code, response_headers = self.fetcher.fetch_with_headers(
+            client, method, url, data, request_headers, json
+        )
+        if status_code == 304 and stale is not None:
+            self.cache.revalidate(key)
+            instrumentation.incr("cache.revalidated")
+            return stale[0], 200
+        if status_code == 200:
+            self.cache.put(key, content, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+        return content, status_code
@@ -0,0 +1,225 @@
+# discogs_dump.py
+"""
+Offline matching against the public Discogs data dump.
+
+The monthly releases dump (https://data.discogs.com/, discogs_YYYYMMDD_releases.xml.gz)
+is stream-parsed into a compact SQLite index with full-text search, which
+lookup_release consults before the live API.
+
+Usage:
+    python discogs_dump.py ingest discogs_20240101_releases.xml.gz [--index PATH]
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from discogs_cache import DEFAULT_CACHE_DIR
+from matching import normalize
+from name_parser import normalize_catno
+
+DEFAULT_INDEX_PATH = os.path.join(DEFAULT_CACHE_DIR, "discogs_index.sqlite3")
+
+
+def _text(elem, path):
+    found = elem.find(path)
+    return (found.text or "").strip() if found is not None and found.text else ""
+
+
+def parse_release(elem):
+    """
+    Converts a <release> element of the dump into the dictionary shape of the
+    Discogs API (/releases/<id>), reduced to the fields used for matching and for
+    the folder layout (country, genres, styles).
+    """
+    released = _text(elem, "released")
+    year = int(released[:4]) if released[:4].isdigit() else 0
+    artists = [
+        {"id": int(_text(a, "id") or 0), "name": _text(a, "name")}
+        for a in elem.iterfind("artists/artist")
+    ]
+    labels = [
+        {"id": int(l.get("id") or 0), "name": l.get("name", ""), "catno": l.get("catno", "")}
+        for l in elem.iterfind("labels/label")
+    ]
+    tracklist = [
+        {"position": _text(t, "position"), "title": _text(t, "title")}
+        for t in elem.iterfind("tracklist/track")
+    ]
+    return {
+        "id": int(elem.get("id")),
+        "title": _text(elem, "title"),
+        "year": year,
+        "country": _text(elem, "country"),
+        "genres": [g.text.strip() for g in elem.iterfind("genres/genre") if g.text and g.text.strip()],
+        "styles": [st.text.strip() for st in elem.iterfind("styles/style") if st.text and st.text.strip()],
+        "artists": artists,
+        "labels": labels,
+        "tracklist": tracklist,
+        # Search results expose the first catalog number at the top level; keep that shape.
+        "catno": labels[0]["catno"] if labels else "",
+    }
+
+
+def iter_releases(path):
+    """
+    Yields release dictionaries from a releases dump (.xml or .xml.gz) in constant
+    memory: every element is discarded as soon as it has been converted.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as stream:
+        context = ET.iterparse(stream, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event == "end" and elem.tag == "release":
+                if elem.get("id"):
+                    yield parse_release(elem)
+                root.clear()
+
+
+class LocalIndex:
+    """
+    SQLite index of Discogs releases with an FTS5 table over artist, title,
+    track titles, labels and catalog numbers.
+
+    Parameters:
+      - path: Location of the index database (created if missing).
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS releases (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS release_fts USING fts5("
+            " artist, title, tracks, label, catno,"
+            " tokenize='unicode61 remove_diacritics 2')"
+        )
+        self._conn.commit()
+
+    def ingest(self, releases, batch_size=5000, progress=None):
+        """
+        Adds (or replaces) releases in the index. progress, if given, is called with
+        the number of releases stored so far after every batch. Returns that number.
+        """
+        count = 0
+        batch = []
+        for release in releases:
+            batch.append(release)
+            if len(batch) >= batch_size:
+                count += self._store(batch)
+                batch = []
+                if progress:
+                    progress(count)
+        if batch:
+            count += self._store(batch)
+            if progress:
+                progress(count)
+        return count
+
+    def _store(self, batch):
+        rows = []
+        fts_rows = []
+        for release in batch:
+            rows.append((release["id"], json.dumps(release, separators=(",", ":"), ensure_ascii=False)))
+            fts_rows.append((
+                release["id"],
+                normalize(" ".join(a["name"] for a in release["artists"])),
+                normalize(release["title"]),
+                normalize(" ".join(t["title"] for t in release["tracklist"])),
+                normalize(" ".join(l["name"] for l in release["labels"])),
+                " ".join(l["catno"] for l in release["labels"]),
+            ))
+        with self._lock:
+            # FTS rows cannot be replaced in place; drop the old entries of re-ingested releases.
+            self._conn.executemany("DELETE FROM release_fts WHERE rowid = ?", [(row[0],) for row in rows])
+            self._conn.executemany("INSERT OR REPLACE INTO releases (id, data) VALUES (?, ?)", rows)
+            self._conn.executemany(
+                "INSERT INTO release_fts (rowid, artist, title, tracks, label, catno) VALUES (?, ?, ?, ?, ?, ?)",
+                fts_rows,
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def search(self, query, limit=50):
+        """
+        Full-text search over the index. Returns up to `limit` release dictionaries
+        (API shape), best matches first.
+        """
+        terms = normalize(query).split()
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.data FROM release_fts JOIN releases r ON r.id = release_fts.rowid"
+                " WHERE release_fts MATCH ? ORDER BY release_fts.rank LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def search_catno(self, catno, limit=20):
+        """
+        Returns the releases (API shape) with the given catalog number, however it is
+        spaced or hyphenated ("DKMNTL045", "DKMNTL 045", "DKMNTL-045").
+        """
+        wanted = normalize_catno(catno)
+        if not wanted:
+            return []
+        # The catno column is tokenized, so "DKMNTL 045" is stored as two tokens.
+        spaced = " ".join(re.findall(r"[A-Z]+|\d+", wanted))
+        match = " OR ".join(f'catno : "{variant}"' for variant in {wanted, spaced, normalize(catno)} if variant)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.data FROM release_fts JOIN releases r ON r.id = release_fts.rowid"
+                " WHERE release_fts MATCH ? LIMIT ?",
+                (match, limit * 5),
+            ).fetchall()
+        releases = [json.loads(row[0]) for row in rows]
+        return [r for r in releases if any(normalize_catno(l["catno"]) == wanted for l in r["labels"])][:limit]
+
+    def release(self, release_id):
+        """Returns the release dictionary for release_id, or None if it is not indexed."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM releases WHERE id = ?", (release_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM releases").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a local Discogs index from a releases data dump.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest = subparsers.add_parser("ingest", help="Parse a releases dump (.xml or .xml.gz) into the index.")
+    ingest.add_argument("dump", help="Path to discogs_YYYYMMDD_releases.xml.gz")
+    ingest.add_argument("--index", default=DEFAULT_INDEX_PATH, help=f"Index database (default: {DEFAULT_INDEX_PATH})")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    index = LocalIndex(args.index)
+
+    def progress(count):
+        print(f"{count} releases indexed ({time.time() - started:.0f}s)", file=sys.stderr)
+
+    count = index.ingest(iter_releases(args.dump), progress=progress)
+    index.close()
+    print(f"Indexed {count} releases into {args.index} in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,113 +1,427 @@
 # discogs_utils.py
-import time
-import difflib
+import contextvars
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import discogs_client
-from mutagen import File as MutagenFile
+import instrumentation
+from discogs_cache import CachingFetcher, is_offline_miss
+from http_transport import create_session
+from matching import prepare, text_similarity, best_match
+from name_parser import normalize_catno
+from rate_limiter import RateLimiter, RateLimitedFetcher
+from tag_reader import read_tags
 
-def create_discogs_client(user_token):
+RELEASE_FETCH_WORKERS = 8  # Shared by all lookups; the rate limiter still paces the actual requests.
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+class OfflineMiss(Exception):
+    """Raised by a lookup whose search is not in the cache, in offline mode."""
+
+def create_discogs_client(user_token, cache=None, limiter=None, session=None):
     """
     Initializes and returns a Discogs client using the provided user token.
+    Every network request waits on the given RateLimiter (a new one if omitted);
+    pass the same limiter to several clients that share one token.
+    Requests go over the given requests.Session, by default a pooled, compressed
+    session from http_transport.create_session shared by all worker threads.
+    If a DiscogsCache is given, searches and releases are served from it when possible.
     Raises a RuntimeError if initialization fails.
     """
     try:
         client = discogs_client.Client("DiscogsMusicOrganizer/1.0", user_token=user_token)
+        client._fetcher = RateLimitedFetcher(
+            user_token,
+            limiter if limiter is not None else RateLimiter(),
+            http=session if session is not None else create_session(),
+        )
+        if cache is not None:
+            client._fetcher = CachingFetcher(client._fetcher, cache)
         return client
     except Exception as e:
         raise RuntimeError(f"Error initializing Discogs client: {e}")
 
-def fetch_release_info(d, file_path, file_name):
-    """
-    Extracts the artist and title from the audio file metadata (or filename) and searches Discogs for a matching release.
-    
-    New two-stage matching logic:
-      1. **Strict Matching:**  
-         Uses a higher threshold (0.7) when comparing the file’s track title (if available) and artist.
-      2. **Broad Matching:**  
-         If no strict match is found, uses a lower threshold (0.5) as a fallback.
-         
-    If a match is found (in either mode), returns a dictionary with release details.
+def fetch_release_info(d, file_path, file_name, local_index=None):
+    """
+    Extracts the artist and title (and catalog number, if any) from the audio file metadata (or filename)
+    and searches Discogs for a matching release.
+    See lookup_tags for the matching logic; local_index is an optional LocalIndex
+    of the Discogs data dump that is tried before the API.
+
+    If a match is found, returns a dictionary with release details.
     If no match is found, returns None.
     """
     try:
-        # Attempt to extract metadata via mutagen.
-        audio = MutagenFile(file_path)
-        if audio and "TPE1" in audio and "TIT2" in audio:
-            artist = audio["TPE1"].text[0]
-            title = audio["TIT2"].text[0]
-        else:
-            # Fallback: try splitting the filename on " - "
-            if " - " in file_name:
-                artist, title = file_name.split(" - ", 1)
-            else:
-                artist, title = None, None
-
-        if not (artist and title):
-            return None
-
-        artist = artist.strip()
-        title = title.strip()
-
-        # Use a combined query.
-        query = f"{artist} {title}"
-        results = d.search(query, type="release")
-        time.sleep(1)  # Allow a brief pause for the API response
-
-        if results.count == 0:
-            return None
-
-        # Define thresholds.
-        strict_threshold = 0.7
-        broad_threshold = 0.5
-
-        strict_match = None
-        strict_score = 0.0
-        broad_match = None
-        broad_score = 0.0
-
-        for release in results:
-            # Get release artist(s) as a string.
-            release_artists = " ".join(a.name for a in release.artists) if hasattr(release, "artists") else ""
-            artist_score = difflib.SequenceMatcher(None, artist.lower(), release_artists.lower()).ratio()
-
-            # If the release has a tracklist, compare the file's title to each track title.
-            if hasattr(release, "tracklist") and release.tracklist:
-                best_track_score = 0.0
-                for track in release.tracklist:
-                    track_title = track.title if hasattr(track, "title") else ""
-                    track_score = difflib.SequenceMatcher(None, title.lower(), track_title.lower()).ratio()
-                    if track_score > best_track_score:
-                        best_track_score = track_score
-                # Combined score: 70% from best track match and 30% from artist match.
-                combined_score = (0.7 * best_track_score) + (0.3 * artist_score)
-            else:
-                # Fallback: compare file title with release title.
-                release_title = release.title if hasattr(release, "title") else ""
-                title_score = difflib.SequenceMatcher(None, title.lower(), release_title.lower()).ratio()
-                combined_score = (0.7 * title_score) + (0.3 * artist_score)
-
-            # Update strict match if threshold met.
-            if combined_score >= strict_threshold and combined_score > strict_score:
-                strict_score = combined_score
-                strict_match = release
-
-            # Also update broad match if threshold met.
-            if combined_score >= broad_threshold and combined_score > broad_score:
-                broad_score = combined_score
-                broad_match = release
-
-        # Choose the strict match if available; otherwise, use the broad match.
-        best_release = strict_match if strict_match is not None else broad_match
-        if best_release is None:
-            return None
-
-        label = best_release.labels[0].name if best_release.labels else "Unknown Label"
-        return {
-            "Year": best_release.year if hasattr(best_release, "year") else "Unknown",
-            "Catalog Number": best_release.data.get("catno", "Unknown"),
-            "Artist": ", ".join(a.name for a in best_release.artists),
-            "Title": best_release.title,
-            "Label": label,
-        }
+        with instrumentation.span("fetch_release_info"):
+            return lookup_tags(d, read_tags(file_path, file_name), local_index=local_index)
+    except OfflineMiss:
+        print(f"Not found (offline): {file_name}", file=sys.stderr)
+        return None
     except Exception as e:
-        print(f"Error fetching release info: {e}")
-        return None
\ No newline at end of file
+        print(f"Error fetching release info: {e}", file=sys.stderr)
+        return None
+
+def _prescore(artist, title, data):
+    """
+    Cheap phase-one score computed from a search result alone (no extra request).
+    Search results carry the release title as "Artist - Title"; releases from the
+    local dump index come with their artists and tracklist, so a track title is
+    also compared with the tracks.
+    """
+    if "artists" in data:
+        release_artist = " ".join(a.get("name", "") for a in data["artists"])
+        release_title = data.get("title", "")
+    else:
+        release_artist, _, release_title = data.get("title", "").partition(" - ")
+    artist_score = text_similarity(artist, release_artist)
+    title_score = text_similarity(title, release_title)
+    if data.get("tracklist"):
+        title_score = max(title_score, best_match(title, [t.get("title", "") for t in data["tracklist"]])[1])
+    return (0.7 * title_score) + (0.3 * artist_score)
+
+def _track_titles(release):
+    tracklist = release.tracklist if hasattr(release, "tracklist") else []
+    return [prepare(track.title or "") for track in tracklist]
+
+def _score_release(artist, title, release):
+    """
+    Full phase-two score. Reading artists/tracklist loads the complete release
+    (one request, or a cache hit).
+    """
+    # Get release artist(s) as a string.
+    release_artists = " ".join(a.name for a in release.artists) if hasattr(release, "artists") else ""
+    artist_score = text_similarity(artist, release_artists)
+
+    # If the release has a tracklist, compare the file's title to all track titles at once.
+    track_titles = _track_titles(release)
+    if track_titles:
+        _, best_track_score = best_match(title, track_titles)
+        # Combined score: 70% from best track match and 30% from artist match.
+        return (0.7 * best_track_score) + (0.3 * artist_score)
+
+    # Fallback: compare file title with release title.
+    release_title = release.title if hasattr(release, "title") else ""
+    title_score = text_similarity(title, release_title)
+    return (0.7 * title_score) + (0.3 * artist_score)
+
+def _catno_boost(catno, data):
+    """
+    Phase-one bonus for a search result or dump release carrying the wanted catalog
+    number (already normalized); it outranks any result without it.
+    """
+    if not catno:
+        return 0.0
+    if "labels" in data:
+        catnos = [label.get("catno", "") for label in data["labels"]]
+    else:
+        catnos = [data.get("catno", "")]
+    return 1.0 if any(normalize_catno(c) == catno for c in catnos) else 0.0
+
+def _release_fetch_pool():
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=RELEASE_FETCH_WORKERS, thread_name_prefix="release-fetch")
+        return _fetch_pool
+
+def _fetch_and_score(score, release):
+    # Loads the full release first (one request, or a cache hit), so that fetching
+    # and scoring are timed separately.
+    with instrumentation.span("release.fetch"):
+        release.fetch("tracklist")
+    with instrumentation.span("match.score"):
+        return score(release)
+
+def _release_info(release, score):
+    label = release.labels[0].name if release.labels else "Unknown Label"
+    genres = release.data.get("genres") or ["Unknown"]
+    styles = release.data.get("styles") or ["Unknown"]
+    return {
+        "Year": release.year if hasattr(release, "year") else "Unknown",
+        # Search results carry "catno"; full releases only have it per label.
+        "Catalog Number": release.data.get("catno") or (release.data.get("labels") or [{}])[0].get("catno") or "Unknown",
+        "Artist": ", ".join(a.name for a in release.artists),
+        "Title": release.title,
+        "Label": label,
+        "Country": release.data.get("country") or "Unknown",
+        "Genre": genres[0],
+        "Style": styles[0],
+        "Release ID": release.id,
+        "Score": round(score, 3),
+    }
+
+def _best_candidate(candidates, score, parallel):
+    """
+    Phase two of the matching: fetches and scores candidates (already in rank order),
+    up to `parallel` at a time, and stops fetching once a strict match is confirmed.
+    Returns (release, score) for the best candidate above the broad threshold, or (None, 0.0).
+    """
+    # Define thresholds.
+    strict_threshold = 0.7
+    broad_threshold = 0.5
+
+    best_release = None
+    best_score = 0.0
+
+    pool = _release_fetch_pool()
+    remaining = iter(candidates)
+    in_flight = deque()
+
+    def submit_next():
+        release = next(remaining, None)
+        if release is not None:
+            future = pool.submit(contextvars.copy_context().run, _fetch_and_score, score, release)
+            in_flight.append((release, future))
+
+    for _ in range(parallel):
+        submit_next()
+    try:
+        while in_flight:
+            release, future = in_flight.popleft()
+            combined_score = future.result()
+            if combined_score >= broad_threshold and combined_score > best_score:
+                best_score = combined_score
+                best_release = release
+            if best_score >= strict_threshold:
+                break
+            submit_next()
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+    if best_release is not None:
+        instrumentation.observe("match.score", best_score)
+    # A strict match wins when there is one; otherwise the best broad match is used.
+    return best_release, best_score
+
+def _local_candidates(d, data, prescore, top_k):
+    # Releases from the local dump index, ranked like the results of a search page.
+    candidates = [discogs_client.models.Release(d, item) for item in data]
+    return sorted(candidates, key=lambda r: prescore(r.data), reverse=True)[:top_k]
+
+def _search_catno(d, catno, prescore, score, top_k, parallel):
+    """
+    Match among the Discogs search results for the catno field, which returns a
+    handful of precise results instead of a page of fuzzy ones. A failing search
+    (e.g. a catalog number missing from the offline cache) counts as no match.
+    Returns (release, score) for the best release, or (None, 0.0).
+    """
+    try:
+        with instrumentation.span("discogs.search_catno"):
+            results = d.search(catno=catno, type="release")
+            if results.count == 0:
+                return None, 0.0
+            first_page = results.page(1)
+    except discogs_client.exceptions.HTTPError:
+        return None, 0.0
+    # Exact catalog numbers are boosted by prescore; the catno field is matched loosely.
+    with instrumentation.span("match.prescore"):
+        candidates = sorted(first_page, key=lambda r: prescore(r.data), reverse=True)[:top_k]
+    return _best_candidate(candidates, score, parallel)
+
+def _find_release(d, query, prescore, score, top_k, parallel, local_index=None, catno=None):
+    """
+    Runs the two-phase match for query. The local dump index (if given) is asked
+    first, by catalog number (if given) and then by free text; the live Discogs
+    search only if that finds nothing, again by catalog number first. A catalog
+    number in a file name can be wrong, so every step falls through to the next.
+    Returns (release, score) for the best release, or (None, 0.0). Raises OfflineMiss
+    if the free-text search is not in the cache in offline mode.
+    """
+    if catno:
+        wanted = normalize_catno(catno)
+        base_prescore = prescore
+        prescore = lambda data: _catno_boost(wanted, data) + base_prescore(data)
+
+    if local_index is not None:
+        if catno:
+            with instrumentation.span("local_index.search_catno"):
+                candidates = _local_candidates(d, local_index.search_catno(catno), prescore, top_k)
+            best_release, best_score = _best_candidate(candidates, score, parallel)
+            if best_release is not None:
+                instrumentation.incr("lookups.catno_matched")
+                return best_release, best_score
+        with instrumentation.span("local_index.search"):
+            candidates = _local_candidates(d, local_index.search(query), prescore, top_k)
+        best_release, best_score = _best_candidate(candidates, score, parallel)
+        if best_release is not None:
+            return best_release, best_score
+
+    if catno:
+        best_release, best_score = _search_catno(d, catno, prescore, score, top_k, parallel)
+        if best_release is not None:
+            instrumentation.incr("lookups.catno_matched")
+            return best_release, best_score
+
+    try:
+        with instrumentation.span("discogs.search"):
+            results = d.search(query, type="release")
+            if results.count == 0:
+                instrumentation.incr("lookups.unmatched")
+                return None, 0.0
+            first_page = results.page(1)
+    except discogs_client.exceptions.HTTPError as e:
+        if not is_offline_miss(e):
+            raise
+        # Not an error: the search was never cached, so the result is unknown.
+        instrumentation.incr("lookups.offline_miss")
+        raise OfflineMiss(query) from e
+
+    # Phase one: rank the first page of results using the search data only.
+    # (Iterating over `results` would also request every further page.)
+    with instrumentation.span("match.prescore"):
+        candidates = sorted(first_page, key=lambda r: prescore(r.data), reverse=True)[:top_k]
+
+    # Phase two: full scoring of the best candidates.
+    best_release, best_score = _best_candidate(candidates, score, parallel)
+    if best_release is None:
+        instrumentation.incr("lookups.unmatched")
+    return best_release, best_score
+
+def release_by_id(d, release_id, track_position=None, local_index=None):
+    """
+    Returns the release details for a known Discogs release ID (e.g. from the file's
+    tags), with a "Score" of 1.0 and the given "Track Position". The local index is
+    used when it has the release, otherwise the release is fetched (through the
+    client's cache). Returns None if the release cannot be loaded.
+    """
+    data = local_index.release(release_id) if local_index is not None else None
+    release = discogs_client.models.Release(d, data) if data else d.release(release_id)
+    try:
+        with instrumentation.span("release.fetch"):
+            release.fetch("title")
+        release_info = _release_info(release, 1.0)
+    except discogs_client.exceptions.HTTPError:
+        return None
+    instrumentation.incr("lookups.by_release_id")
+    release_info["Track Position"] = track_position
+    return release_info
+
+def lookup_tags(d, tags, local_index=None):
+    """
+    Finds the release of a file from its tags (as returned by tag_reader.read_tags).
+
+    Files that carry a Discogs release ID written by an earlier match (see
+    tag_reader.write_release_tags) skip the search: the release is fetched by its
+    ID (one request, or none when it is cached or in the local index). Otherwise,
+    or if that release cannot be loaded, lookup_release searches by artist, title
+    and catalog number.
+
+    Returns the release details dictionary, or None if there is no match or the
+    tags lack the artist or title. Errors are raised like in lookup_release.
+    """
+    if tags.get("discogs_release_id"):
+        release_info = release_by_id(d, tags["discogs_release_id"], tags.get("discogs_track_position"),
+                                     local_index=local_index)
+        if release_info is not None:
+            return release_info
+    if not (tags.get("artist") and tags.get("title")):
+        return None
+    return lookup_release(d, tags["artist"], tags["title"], local_index=local_index, catno=tags.get("catno"))
+
+def lookup_release(d, artist, title, top_k=5, parallel=2, local_index=None, catno=None):
+    """
+    Searches Discogs for a release matching the given artist and track title.
+
+    Candidates are ranked in two phases so that only a few full releases are fetched:
+      1. **Pre-ranking:**  
+         Every result on the first search page is scored from the fields the search
+         response already contains (the "Artist - Title" string), without extra requests.
+      2. **Full scoring:**  
+         The top_k candidates are fetched, up to `parallel` at a time (through the
+         client's cache and rate limiter), and scored against their artists and
+         tracklist. No further releases are fetched once a strict match is confirmed.
+
+    Thresholds:
+      - **Strict Matching:** 0.7, preferred whenever one is found.
+      - **Broad Matching:** 0.5, used as a fallback.
+
+    If a LocalIndex built from the Discogs data dump is given, it is searched first
+    and the API is only used when it has no match.
+
+    If the catalog number is known (catno, e.g. from the tags or file name), the
+    releases with that catalog number are tried first, and free text is only the
+    fallback; in that fallback, results with the catalog number are ranked first.
+
+    If a match is found (in either mode), returns a dictionary with release details,
+    including its "Release ID", match "Score" and the "Track Position" of the title
+    on the release (None if it is not on the tracklist).
+    If no match is found, returns None. API errors are raised to the caller; in
+    offline mode, a search that is not cached raises OfflineMiss.
+    """
+    # Use a combined query.
+    query = f"{artist} {title}"
+    best_release, best_score = _find_release(
+        d, query,
+        lambda data: _prescore(artist, title, data),
+        lambda release: _score_release(artist, title, release),
+        top_k, parallel, local_index, catno,
+    )
+    if best_release is None:
+        return None
+    release_info = _release_info(best_release, best_score)
+    release_info["Track Position"] = map_tracks([title], best_release)[0]
+    return release_info
+
+def _score_album(artist, album, titles, release):
+    """
+    Scores a release against a group of tracks from one record: the release title
+    is compared with the album name and the group's titles with the tracklist
+    (average of each title's best track match); the better of the two counts.
+    """
+    release_artists = " ".join(a.name for a in release.artists) if hasattr(release, "artists") else ""
+    artist_score = text_similarity(artist, release_artists)
+
+    release_title = release.title if hasattr(release, "title") else ""
+    album_score = text_similarity(album, release_title) if album else 0.0
+
+    coverage = 0.0
+    track_titles = _track_titles(release)
+    if track_titles and titles:
+        coverage = sum(best_match(title, track_titles)[1] for title in titles) / len(titles)
+
+    return (0.7 * max(album_score, coverage)) + (0.3 * artist_score)
+
+def map_tracks(titles, release, threshold=0.5):
+    """
+    Maps each title to the position of its best matching track on the release
+    (e.g. "A1"), locally and without further requests. Unmatched titles map to None.
+    """
+    tracklist = release.tracklist if hasattr(release, "tracklist") else []
+    track_titles = [prepare(track.title or "") for track in tracklist]
+    positions = []
+    for title in titles:
+        index, _ = best_match(title, track_titles, floor=threshold)
+        positions.append(tracklist[index].position if index is not None else None)
+    return positions
+
+def lookup_album(d, artist, album, titles, top_k=5, parallel=2, local_index=None, catno=None):
+    """
+    Resolves a group of tracks from the same record with a single release match.
+
+    Parameters:
+      - artist: The (album) artist shared by the group.
+      - album: The album name, or None if only the track titles are known.
+      - titles: The track titles of the group, used for tracklist scoring.
+      - local_index: (Optional) LocalIndex searched before the API.
+      - catno: (Optional) The record's catalog number, tried before the free-text search.
+
+    Uses the same two-phase ranking and thresholds as lookup_release. Returns the
+    release details dictionary plus a "Track Positions" list (aligned with titles,
+    None where a title is not on the tracklist), or None if nothing matched. Raises
+    OfflineMiss like lookup_release.
+    """
+    query = f"{artist} {album}" if album else f"{artist} {titles[0]}"
+    best_release, best_score = _find_release(
+        d, query,
+        lambda data: _prescore(artist, album or titles[0], data),
+        lambda release: _score_album(artist, album, titles, release),
+        top_k, parallel, local_index, catno,
+    )
+    if best_release is None:
+        return None
+    release_info = _release_info(best_release, best_score)
+    release_info["Track Positions"] = map_tracks(titles, best_release)
+    return release_info
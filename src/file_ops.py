@@ -0,0 +1,154 @@
+# file_ops.py
+import os
+import shutil
+import sys
+import threading
+import instrumentation
+
+# ioctl request number of FICLONE (linux/fs.h): share the extents of one file with another.
+_FICLONE = 0x40049409
+_COPY_CHUNK = 64 * 1024 * 1024
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_clonefile = None
+if sys.platform == "darwin":
+    try:
+        import ctypes
+        import ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        _clonefile = _libc.clonefile
+        _clonefile.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int)
+        _clonefile.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _clonefile = None
+
+
+def _reflink(src, dest):
+    """Clones src to dest (copy-on-write, no data copied). Returns False if unsupported."""
+    if _clonefile is not None:
+        # APFS; clonefile() creates dest itself.
+        return _clonefile(os.fsencode(src), os.fsencode(dest), 0) == 0
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            return False  # Not Btrfs/XFS/..., or different file systems.
+
+
+def _copy_data(src, dest):
+    """
+    Copies the contents of src to dest inside the kernel where possible
+    (copy_file_range, then sendfile), falling back to a buffered copy.
+    """
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for kernel_copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if kernel_copy is None or not sys.platform.startswith("linux"):
+                continue
+            try:
+                offset = 0
+                while offset < size:
+                    if kernel_copy is os.sendfile:
+                        sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, min(_COPY_CHUNK, size - offset))
+                    else:
+                        sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(_COPY_CHUNK, size - offset), offset, offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                if offset >= size:
+                    return
+            except OSError:
+                pass  # Unsupported here; start over with the next method.
+            fdst.seek(0)
+            fdst.truncate()
+        fsrc.seek(0)
+        shutil.copyfileobj(fsrc, fdst, _COPY_CHUNK)
+
+
+class FileOps:
+    """
+    Moves and copies files into the organized folders as cheaply as the file
+    systems allow.
+
+    - Moves within one file system are a single atomic rename.
+    - Copies are reflink clones where supported (Btrfs/XFS FICLONE, APFS clonefile),
+      otherwise in-kernel copies (copy_file_range/sendfile).
+    - Every file is written under a temporary name in the target folder and renamed
+      into place when complete, so a partial file never appears under its real name.
+    - Target folders are created once per run.
+    - Copies run concurrently, at most `per_device` at a time onto the same device.
+
+    Parameters:
+      - per_device: Maximum number of concurrent copies per destination device.
+    """
+
+    def __init__(self, per_device=2):
+        self.per_device = per_device
+        self._lock = threading.Lock()
+        self._dirs = {}
+        self._slots = {}
+        self.renamed = 0
+        self.cloned = 0
+        self.copied = 0
+
+    def ensure_dir(self, path):
+        """Creates path (once per run) and returns the device it lives on."""
+        with self._lock:
+            device = self._dirs.get(path)
+        if device is None:
+            os.makedirs(path, exist_ok=True)
+            device = os.stat(path).st_dev
+            with self._lock:
+                self._dirs[path] = device
+        return device
+
+    def move(self, src, dest):
+        dest_dir = os.path.dirname(dest)
+        device = self.ensure_dir(dest_dir)
+        if os.stat(src).st_dev == device:
+            with instrumentation.span("file_ops.rename"):
+                os.replace(src, dest)
+            with self._lock:
+                self.renamed += 1
+            instrumentation.incr("file_ops.renamed")
+            return
+        self._copy(src, dest, device)
+        os.remove(src)
+
+    def copy(self, src, dest):
+        device = self.ensure_dir(os.path.dirname(dest))
+        self._copy(src, dest, device)
+
+    def _copy(self, src, dest, device):
+        with self._lock:
+            slots = self._slots.setdefault(device, threading.BoundedSemaphore(self.per_device))
+        temp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.{os.getpid()}.{threading.get_ident()}.part")
+        with instrumentation.span("file_ops.wait_for_device"):
+            slots.acquire()
+        try:
+            with instrumentation.span("file_ops.copy"):
+                cloned = _reflink(src, temp)
+                if not cloned:
+                    _copy_data(src, temp)
+                shutil.copymode(src, temp)
+                os.replace(temp, dest)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        finally:
+            slots.release()
+        with self._lock:
+            if cloned:
+                self.cloned += 1
+            else:
+                self.copied += 1
+        instrumentation.incr("file_ops.cloned" if cloned else "file_ops.copied")
+        instrumentation.incr("file_ops.bytes_cloned" if cloned else "file_ops.bytes_copied", os.path.getsize(dest))
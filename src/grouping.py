@@ -0,0 +1,118 @@
+# grouping.py
+import os
+import threading
+from name_parser import split_track_number
+
+# Key of the marker item the organizer sends once every file of a directory has
+# passed (its value is the directory); the groups of that directory are complete then.
+DIRECTORY_DONE = "directory_done"
+
+
+def _strip_track_number(text):
+    # Same rules as for file names: "50 Cent" and "2 Unlimited" keep their number.
+    return split_track_number(text)[1].strip()
+
+
+def album_key(item):
+    """
+    Determines which record a file belongs to.
+
+    Files are clustered by their album and album-artist tags when present,
+    otherwise by a common "Artist - Album - " filename prefix (at least three
+    " - " separated parts are required, so plain "Artist - Title" singles are
+    never grouped). Either way only files in the same directory are grouped:
+    the same tags elsewhere in a library may belong to another pressing.
+
+    Returns (key, artist, album, title), or None if the file cannot be grouped.
+    """
+    tags = item["tags"]
+    if tags.get("album"):
+        artist = tags.get("albumartist") or tags.get("artist")
+        if artist and tags.get("title"):
+            key = ("tags", os.path.dirname(item["path"]), artist.casefold(), tags["album"].casefold())
+            return key, artist, tags["album"], tags["title"]
+        return None
+
+    # "01 - Artist - Album - Title"
+    parts = [part.strip() for part in _strip_track_number(item["name"]).split(" - ")]
+    if len(parts) < 3 or not all(parts):
+        return None
+    artist = parts[0]
+    album = parts[1]
+    title = _strip_track_number(parts[-1])
+    if not (artist and album and title):
+        return None
+    key = ("prefix", os.path.dirname(item["path"]), artist.casefold(), album.casefold())
+    return key, artist, album, title
+
+
+class AlbumGrouper:
+    """
+    Pipeline stage that holds files back until their record is complete and then
+    emits them as one group, so a single Discogs lookup serves the whole release.
+
+    A group is emitted as soon as its track count reaches the "tracktotal" tag, or
+    when a DIRECTORY_DONE marker for its directory arrives, or when the input is
+    exhausted (flush). Files that cannot be grouped, and groups that end up with a
+    single file, are passed on unchanged.
+    """
+
+    def __init__(self):
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def add(self, item, emit):
+        if DIRECTORY_DONE in item:
+            self._flush_directory(item[DIRECTORY_DONE], emit)
+            return
+        if "dest" in item:
+            emit(item)  # Already decided (e.g. replayed from the journal).
+            return
+        grouping = album_key(item)
+        if grouping is None:
+            emit(item)
+            return
+        key, artist, album, title = grouping
+        with self._lock:
+            group = self._groups.setdefault(key, {"artist": artist, "album": album, "members": [], "titles": []})
+            group["members"].append(item)
+            group["titles"].append(title)
+            complete = self._is_complete(group)
+            if complete:
+                del self._groups[key]
+        if complete:
+            emit(group)
+
+    def flush(self, emit):
+        with self._lock:
+            groups = list(self._groups.values())
+            self._groups.clear()
+        self._emit_groups(groups, emit)
+
+    def _flush_directory(self, directory, emit):
+        with self._lock:
+            keys = [key for key in self._groups if key[1] == directory]
+            groups = [self._groups.pop(key) for key in keys]
+        self._emit_groups(groups, emit)
+
+    @staticmethod
+    def _emit_groups(groups, emit):
+        for group in groups:
+            if len(group["members"]) == 1:
+                emit(group["members"][0])
+            else:
+                emit(group)
+
+    @staticmethod
+    def _is_complete(group):
+        members = group["members"]
+        if len(members) < 2:
+            return False
+        tags = [member["tags"] for member in members]
+        if any((t.get("discnumber") or 1) > 1 for t in tags):
+            return False  # Multi-disc records wait until their directory is done.
+        totals = {t.get("tracktotal") for t in tags}
+        if len(totals) != 1 or None in totals:
+            return False
+        numbers = {t.get("tracknumber") for t in tags}
+        return len(numbers) >= totals.pop()
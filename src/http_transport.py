@@ -0,0 +1,22 @@
+# http_transport.py
+import requests
+from requests.adapters import HTTPAdapter
+
+# Lookup workers x parallel candidate fetches plus the shared release fetch pool
+# stay below this, so requests never wait for a free connection.
+DEFAULT_POOL_SIZE = 16
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Returns a requests.Session for the Discogs API that is shared by all worker
+    threads: a keep-alive pool of up to pool_size connections per host (TLS is
+    negotiated once per connection, not once per request). requests already asks
+    for gzip-compressed responses.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
@@ -0,0 +1,186 @@
+# instrumentation.py
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets; match scores are in [0, 1].
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+_metrics = contextvars.ContextVar("metrics", default=None)
+
+
+class Metrics:
+    """
+    Timing spans, counters and histograms collected during a run.
+
+    Code records into whichever Metrics is active (see collect()); with none
+    active, span(), incr() and observe() return immediately.
+
+    Parameters:
+      - on_event: (Optional) Called as on_event(kind, name, value) for every
+                  recorded value; kind is "span" (seconds), "counter" or "observation".
+    """
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.counters = {}
+        self.spans = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.on_event:
+            self.on_event("counter", name, value)
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                span[0] += 1
+                span[1] += seconds
+                span[2] = max(span[2], seconds)
+        if self.on_event:
+            self.on_event("span", name, seconds)
+
+    def observe(self, name, value, buckets=SCORE_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {"buckets": list(buckets), "counts": [0] * len(buckets),
+                                                     "count": 0, "sum": 0.0}
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += value
+        if self.on_event:
+            self.on_event("observation", name, value)
+
+    def summary(self):
+        """Returns everything recorded so far as a JSON-serializable dictionary."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "duration_seconds": round(time.time() - self.started, 3),
+                "counters": {name: round(value, 6) if isinstance(value, float) else value
+                             for name, value in sorted(self.counters.items())},
+                "spans": {
+                    name: {"count": count, "total_seconds": round(total, 6), "max_seconds": round(peak, 6)}
+                    for name, (count, total, peak) in sorted(self.spans.items())
+                },
+                "histograms": {
+                    name: {"buckets": dict(zip(map(str, h["buckets"]), h["counts"])), "count": h["count"],
+                           "sum": round(h["sum"], 6)}
+                    for name, h in sorted(self.histograms.items())
+                },
+            }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path, prefix="musicorganizer"):
+        """Writes the metrics in the Prometheus text format (for node_exporter's textfile collector)."""
+        summary = self.summary()
+        lines = []
+        for name, value in summary["counters"].items():
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, span in summary["spans"].items():
+            metric = f"{prefix}_{_metric_name(name)}_seconds"
+            lines += [f"# TYPE {metric} summary", f"{metric}_sum {span['total_seconds']}",
+                      f"{metric}_count {span['count']}"]
+        for name, histogram in summary["histograms"].items():
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f'{metric}_bucket{{le="+Inf"}} {histogram["count"]}', f"{metric}_sum {histogram['sum']}",
+                      f"{metric}_count {histogram['count']}"]
+        lines.append(f"{prefix}_last_run_timestamp_seconds {math.floor(summary['started'])}")
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _write_atomic(path, text):
+    # Readers (e.g. the textfile collector) never see a half-written file.
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp, path)
+
+
+@contextmanager
+def collect(metrics):
+    """
+    Makes metrics the active Metrics for the code inside the with-block, including
+    threads started through contextvars.copy_context().run (e.g. pipeline stages).
+    """
+    token = _metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _metrics.reset(token)
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_span(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    """Context manager timing its block as `name` in the active Metrics."""
+    metrics = _metrics.get()
+    return _NO_SPAN if metrics is None else _Span(metrics, name)
+
+
+def incr(name, value=1):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.incr(name, value)
+
+
+def observe(name, value, buckets=SCORE_BUCKETS):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.observe(name, value, buckets)
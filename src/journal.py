@@ -0,0 +1,145 @@
+# journal.py
+import os
+import json
+import sqlite3
+import threading
+import time
+from discogs_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_JOURNAL_PATH = os.path.join(DEFAULT_CACHE_DIR, "journal.sqlite3")
+
+# Row states:
+#   decided - the match is known and the destination chosen, the file operation has not completed
+#   done    - the file operation completed
+#   output  - a file written by a completed operation (skipped when the folder is scanned again)
+DECIDED = "decided"
+DONE = "done"
+OUTPUT = "output"
+
+
+def file_identity(stat_result):
+    """(size, mtime in ns) of a stat result; a file whose identity changed is processed again."""
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+class Journal:
+    """
+    Write-ahead journal of organize_files runs, so an interrupted run can resume.
+
+    For every source file it records its (path, size, mtime) identity, the match
+    decision with its destination, and whether the file operation completed.
+    A decision is committed before the file is touched and marked done afterwards.
+
+    Parameters:
+      - path: Location of the SQLite database (created if missing).
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " action TEXT,"
+            " dest TEXT,"
+            " release TEXT,"
+            " updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_state ON files (state)")
+        self._conn.commit()
+
+    def get(self, path, identity):
+        """
+        Returns the journal entry for path as a dictionary, or None if there is none
+        or the file changed since it was recorded.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, action, dest, release, size, mtime_ns FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None or (row[4], row[5]) != tuple(identity):
+            return None
+        return {
+            "state": row[0],
+            "action": row[1],
+            "dest": row[2],
+            "release_info": json.loads(row[3]) if row[3] else None,
+        }
+
+    def record_decision(self, path, identity, action, dest, release_info):
+        """Commits the match decision for a source file before its file operation starts."""
+        release = json.dumps(release_info) if release_info else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, state, action, dest, release, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, identity[0], identity[1], DECIDED, action, dest, release, time.time()),
+            )
+            self._conn.commit()
+
+    def record_done(self, path, dest, dest_identity):
+        """Marks the operation of a source file as completed and remembers the file it produced."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE files SET state = ?, updated = ? WHERE path = ?", (DONE, now, path))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, state, action, dest, release, updated)"
+                " VALUES (?, ?, ?, ?, NULL, NULL, NULL, ?)",
+                (dest, dest_identity[0], dest_identity[1], OUTPUT, now),
+            )
+            self._conn.commit()
+
+    def record_skipped(self, path, identity):
+        """Marks a source file that is deliberately left in place (e.g. a skipped duplicate)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, state, action, dest, release, updated)"
+                " VALUES (?, ?, ?, ?, NULL, NULL, NULL, ?)",
+                (path, identity[0], identity[1], DONE, time.time()),
+            )
+            self._conn.commit()
+
+    def record_output(self, path, identity):
+        """Remembers a file written outside a run (e.g. by a re-layout) as organized output."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, state, action, dest, release, updated)"
+                " VALUES (?, ?, ?, ?, NULL, NULL, NULL, ?)",
+                (path, identity[0], identity[1], OUTPUT, time.time()),
+            )
+            self._conn.commit()
+
+    def record_moved(self, old_path, new_path, identity):
+        """Follows an organized file that was moved to new_path (e.g. by a re-layout)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE files SET dest = ?, updated = ? WHERE dest = ?", (new_path, now, old_path))
+            self._conn.execute("DELETE FROM files WHERE path = ? AND state = ?", (old_path, OUTPUT))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, state, action, dest, release, updated)"
+                " VALUES (?, ?, ?, ?, NULL, NULL, NULL, ?)",
+                (new_path, identity[0], identity[1], OUTPUT, now),
+            )
+            self._conn.commit()
+
+    def pending(self, folder):
+        """Yields (path, action, dest) for decided but unfinished operations below folder."""
+        prefix = os.path.join(os.path.abspath(folder), "")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, action, dest FROM files WHERE state = ? AND substr(path, 1, ?) = ?",
+                (DECIDED, len(prefix), prefix),
+            ).fetchall()
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,141 @@
+# matching.py
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Mix descriptors that say nothing about which recording it is ("(Original Mix)", "[Radio Edit]", ...).
+_NEUTRAL_VERSION = re.compile(
+    r"[\(\[]\s*(?:(?:original|extended|radio|album|single|main|clean|dirty)\s+(?:mix|edit|version)"
+    r"|remaster(?:ed)?(?:\s+\d{4})?|\d{4}\s+remaster(?:ed)?)\s*[\)\]]",
+    re.IGNORECASE,
+)
+# Featured artists, either in brackets or trailing ("Artist feat. Someone").
+_FEATURING = re.compile(
+    r"[\(\[]\s*(?:feat|ft|featuring)\b[^\)\]]*[\)\]]|\b(?:feat|ft|featuring)\b\.?\s.*$",
+    re.IGNORECASE,
+)
+# Discogs disambiguation suffix on artist and label names: "Ana Bell (2)".
+_DISAMBIGUATION = re.compile(r"\s\(\d+\)(?=\s|$)")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """
+    Normalizes a title or artist name for comparison: strips diacritics, casefolds,
+    removes neutral mix descriptors, featured-artist credits and Discogs "(2)"
+    suffixes, and reduces punctuation to single spaces.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _DISAMBIGUATION.sub("", text)
+    text = _NEUTRAL_VERSION.sub(" ", text)
+    text = _FEATURING.sub(" ", text)
+    text = text.casefold().replace("&", " and ")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+class MatchString:
+    """
+    A string prepared for matching. Normalization, tokenization and the character
+    histogram used by the upper-bound checks are computed once, here.
+    """
+
+    __slots__ = ("original", "text", "tokens", "chars")
+
+    def __init__(self, original):
+        self.original = original
+        self.text = normalize(original)
+        self.tokens = Counter(self.text.split())
+        self.chars = Counter(self.text)
+
+    def __repr__(self):
+        return f"MatchString({self.original!r})"
+
+
+@lru_cache(maxsize=65536)
+def prepare(text):
+    """Returns the (cached) MatchString for text. Track titles of cached releases repeat a lot."""
+    return MatchString(text)
+
+
+def upper_bound(a, b):
+    """
+    Cheap upper bound for similarity(a, b): the length ratio bound and the
+    character-histogram bound that difflib's real_quick_ratio/quick_ratio use.
+    """
+    total = len(a.text) + len(b.text)
+    if total == 0:
+        return 1.0
+    length_bound = 2.0 * min(len(a.text), len(b.text)) / total
+    if length_bound == 0.0:
+        return 0.0
+    common = sum((a.chars & b.chars).values())
+    return min(length_bound, 2.0 * common / total)
+
+
+def _token_set_strings(a, b):
+    # Shared tokens first, then each side's remaining tokens, so reordered or
+    # partially overlapping titles line up for the sequence comparison. Tokens
+    # are kept as multisets so the strings use exactly the characters of the
+    # normalized text and upper_bound() stays valid for them.
+    common = " ".join(sorted((a.tokens & b.tokens).elements()))
+    rest_a = " ".join(sorted((a.tokens - b.tokens).elements()))
+    rest_b = " ".join(sorted((b.tokens - a.tokens).elements()))
+    return f"{common} {rest_a}".strip(), f"{common} {rest_b}".strip()
+
+
+def similarity(a, b, floor=0.0):
+    """
+    Token-set similarity of two MatchStrings in [0, 1].
+
+    The result is the better of the plain sequence ratio of the normalized strings
+    and the ratio of their token-set forms (shared tokens first). Unlike fuzzy
+    token_set_ratio, a title that is a mere subset of the other does not count as a
+    perfect match, which keeps scores comparable to plain SequenceMatcher ratios
+    (and to the 0.7 / 0.5 matching thresholds).
+
+    If the score cannot reach `floor`, 0.0 is returned without running the full comparison.
+    """
+    if a.text == b.text or (a.tokens and a.tokens == b.tokens):
+        return 1.0
+    if upper_bound(a, b) < floor or not a.text or not b.text:
+        return 0.0
+    score = SequenceMatcher(None, a.text, b.text, autojunk=False).ratio()
+    if a.tokens & b.tokens:
+        set_a, set_b = _token_set_strings(a, b)
+        score = max(score, SequenceMatcher(None, set_a, set_b, autojunk=False).ratio())
+    return score
+
+
+def text_similarity(a, b):
+    """Convenience wrapper: similarity of two plain strings."""
+    return similarity(prepare(a or ""), prepare(b or ""))
+
+
+def best_match(query, candidates, floor=0.0):
+    """
+    Scores one query against a whole list of candidates (e.g. a tracklist) at once.
+
+    Parameters:
+      - query: The string (or MatchString) to look for.
+      - candidates: Strings or MatchStrings to compare against.
+      - floor: Scores below this are not interesting; candidates whose upper bound
+               cannot beat the best score so far (or floor) are skipped.
+
+    Returns (index, score) of the best candidate, or (None, 0.0) if none reaches floor.
+    """
+    query = query if isinstance(query, MatchString) else prepare(query or "")
+    best_index, best_score = None, 0.0
+    for index, candidate in enumerate(candidates):
+        candidate = candidate if isinstance(candidate, MatchString) else prepare(candidate or "")
+        current_floor = max(floor, best_score)
+        if upper_bound(query, candidate) <= current_floor and best_index is not None:
+            continue
+        score = similarity(query, candidate, current_floor)
+        if score >= floor and (best_index is None or score > best_score):
+            best_index, best_score = index, score
+            if score == 1.0:
+                break
+    return best_index, best_score
@@ -9,6 +9,8 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
 import queue
+import time
+from collections import deque
 
 # Ensure that a character detection module is available.
 try:
@@ -17,6 +19,12 @@ except ImportError:
     print("Warning: chardet module not found; requests may issue a warning.", file=sys.stderr)
 
 from discogs_utils import create_discogs_client
+from discogs_cache import DiscogsCache, DEFAULT_CACHE_DIR
+from instrumentation import Metrics
+from discogs_dump import LocalIndex, DEFAULT_INDEX_PATH
+from catalog import Catalog
+from journal import Journal
+from rate_limiter import RateLimiter
 import organizer
 
 # --- Resource Path Setup (UPDATED) ---
@@ -43,6 +51,21 @@ def log_exception(exc):
     except Exception as log_exc:
         print("Failed to write error log:", log_exc)
 
+# --- GUI Update Settings ---
+FRAME_INTERVAL_MS = 100    # The log and progress bar are redrawn at most 10 times per second.
+MAX_LOG_LINES = 2000       # Older lines are dropped from the window; the full log is written to disk.
+THROUGHPUT_WINDOW = 30.0   # Seconds of progress used for the files/min and ETA estimate.
+LOG_DIR = os.path.join(os.path.expanduser("~"), ".musicorganizer", "logs")
+
+# Posted by the worker thread when a run has finished.
+_RUN_FINISHED = object()
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m {seconds % 60:02d}s"
+
 # --- Application Functions ---
 def open_soundcloud():
     webbrowser.open("https://soundcloud.com/ivpalmer")
@@ -67,7 +90,7 @@ def main():
 
     root = tk.Tk()
     root.title("Music Organizer")
-    root.geometry("700x700")
+    root.geometry("700x730")
     root.resizable(False, False)
 
     try:
@@ -117,6 +140,10 @@ def main():
     tk.Radiobutton(options_frame, text="Move Files", variable=action_var, value="move", font=("Helvetica", scale_font(14))).grid(row=0, column=0, padx=10)
     tk.Radiobutton(options_frame, text="Copy Files", variable=action_var, value="copy", font=("Helvetica", scale_font(14))).grid(row=0, column=1, padx=10)
 
+    offline_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(container, text="Offline (use cached Discogs data only)", variable=offline_var,
+                   font=("Helvetica", scale_font(12))).pack(pady=(0, 10))
+
     tk.Label(container, text="WARNING: DJ Softwares might lose reference if you move files",
              font=("Helvetica", scale_font(12)), fg="red").pack(pady=(0, 15))
 
@@ -129,21 +156,79 @@ def main():
     progress = ttk.Progressbar(container, orient="horizontal", length=600, mode="determinate")
     progress.pack(pady=(10, 15))
 
+    status_var = tk.StringVar(value="")
+    tk.Label(container, textvariable=status_var, font=("Helvetica", scale_font(12))).pack(pady=(0, 5))
+
     log_window = tk.Text(container, height=15, width=80, state="disabled", bg="black", fg="white", font=("Helvetica", scale_font(12)))
     log_window.pack(pady=(5, 15))
 
+    # State shared with the worker thread. The worker only posts to log_queue and
+    # overwrites latest_progress; all widgets are updated by refresh() on the Tk thread.
+    latest_progress = [None]
+    run = {"log_file": None, "samples": deque(), "folder": None, "shown": None}
+
     def log_message(message):
         log_queue.put(message)
         print(f"[DEBUG]: {message}")
 
-    def update_log():
-        while not log_queue.empty():
-            message = log_queue.get_nowait()
-            log_window.config(state="normal")
-            log_window.insert("end", f"{message}\n")
-            log_window.config(state="disabled")
-            log_window.see("end")
-        root.after(100, update_log)
+    def append_log(lines):
+        """Appends lines to the log window in one insert and trims it to MAX_LOG_LINES."""
+        lines = lines[-MAX_LOG_LINES:]
+        log_window.config(state="normal")
+        log_window.insert("end", "\n".join(lines) + "\n")
+        excess = int(log_window.index("end-1c").split(".")[0]) - 1 - MAX_LOG_LINES
+        if excess > 0:
+            log_window.delete("1.0", f"{excess + 1}.0")
+        log_window.config(state="disabled")
+        log_window.see("end")
+
+    def show_progress(current, total):
+        progress["maximum"] = max(total, 1)
+        progress["value"] = current
+        now = time.monotonic()
+        samples = run["samples"]
+        samples.append((now, current))
+        while len(samples) > 2 and now - samples[0][0] > THROUGHPUT_WINDOW:
+            samples.popleft()
+        status = f"{current}/{total} files"
+        elapsed = now - samples[0][0]
+        if elapsed > 1 and current > samples[0][1]:
+            rate = (current - samples[0][1]) / elapsed
+            status += f"  ·  {rate * 60:.0f} files/min  ·  ETA {format_duration((total - current) / rate)}"
+        status_var.set(status)
+
+    def finish_run():
+        if run["log_file"] is not None:
+            run["log_file"].close()
+            run["log_file"] = None
+        start_button.config(state=tk.NORMAL)
+        if run["folder"]:
+            open_folder(run["folder"])
+
+    def refresh():
+        """Applies everything the worker posted since the last frame, then schedules the next frame."""
+        lines = []
+        finished = False
+        while True:
+            try:
+                message = log_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is _RUN_FINISHED:
+                finished = True
+            else:
+                lines.append(str(message))
+        if lines:
+            if run["log_file"] is not None:
+                run["log_file"].write("\n".join(lines) + "\n")
+            append_log(lines)
+        current = latest_progress[0]
+        if current is not None and current != run["shown"]:
+            run["shown"] = current
+            show_progress(*current)
+        if finished:
+            finish_run()
+        root.after(FRAME_INTERVAL_MS, refresh)
 
     def select_folder(selected_folder_var):
         folder = filedialog.askdirectory(title="Select your music folder")
@@ -151,32 +236,69 @@ def main():
             selected_folder_var.set(folder)
 
     def progress_callback(current, total):
-        progress["maximum"] = total
-        progress["value"] = current
-        root.update_idletasks()
+        # Called from the worker thread: only the latest value is kept, refresh() shows it.
+        latest_progress[0] = (current, total)
 
-    def start_organizing_threaded(user_token, folder, action):
+    def start_organizing_threaded(user_token, folder, action, offline):
         start_button.config(state=tk.DISABLED)
+        run.update(folder=None, shown=None)
+        run["samples"].clear()
+        latest_progress[0] = None
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            log_path = os.path.join(LOG_DIR, f"run-{datetime.datetime.now():%Y%m%d-%H%M%S}.log")
+            run["log_file"] = open(log_path, "a", encoding="utf-8")
+            log_message(f"Full log: {log_path}")
+        except OSError as e:
+            log_message(f"Could not open the log file: {e}")
+
         def task():
             try:
-                client = create_discogs_client(user_token)
+                cache = DiscogsCache(offline=offline)
+                limiter = RateLimiter()
+                client = create_discogs_client(user_token, cache=cache, limiter=limiter)
             except Exception as e:
                 log_message(f"Error initializing Discogs client: {e}")
-                start_button.config(state=tk.NORMAL)
+                log_queue.put(_RUN_FINISHED)
                 return
-            organizer.organize_files(client, folder, action, log_callback=log_message, progress_callback=progress_callback)
-            open_folder(folder)
-            start_button.config(state=tk.NORMAL)
+            local_index = None
+            if os.path.exists(DEFAULT_INDEX_PATH):
+                # Built with "python discogs_dump.py ingest <dump>"; matched before the API is used.
+                local_index = LocalIndex(DEFAULT_INDEX_PATH)
+                log_message(f"Using local Discogs index ({len(local_index)} releases)")
+            journal = Journal()
+            catalog = Catalog()
+            metrics = Metrics()
+            try:
+                organizer.organize_files(client, folder, action, log_callback=log_message, progress_callback=progress_callback,
+                                         local_index=local_index, journal=journal, metrics=metrics,
+                                         catalog=catalog)
+                run["folder"] = folder
+            except Exception as e:
+                log_exception(e)
+                log_message(f"Organizing stopped because of an error: {e}")
+            try:
+                metrics.write_json(os.path.join(DEFAULT_CACHE_DIR, "last_run.json"))
+            except OSError as e:
+                log_message(f"Could not write the run report: {e}")
+            journal.close()
+            catalog.close()
+            if local_index is not None:
+                local_index.close()
+            log_message(f"Discogs cache: {cache.hits} hits, {cache.misses} misses")
+            log_message(f"Discogs API: {limiter.requests_made} requests, {limiter.time_slept:.1f}s waiting on the rate limit")
+            cache.close()
+            log_queue.put(_RUN_FINISHED)
         threading.Thread(target=task).start()
 
     start_button = tk.Button(container, text="Start Organizing",
-                             command=lambda: start_organizing_threaded(token_entry.get(), selected_folder.get(), action_var.get()),
+                             command=lambda: start_organizing_threaded(token_entry.get(), selected_folder.get(), action_var.get(), offline_var.get()),
                              font=("Helvetica", scale_font(14)))
     start_button.pack(pady=(5, 15))
 
     tk.Button(container, text="Follow Me on SoundCloud", command=open_soundcloud, font=("Helvetica", scale_font(14))).pack(pady=(0, 15))
 
-    update_log()
+    refresh()
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+# name_parser.py
+import re
+
+# All patterns are compiled once at import; parse_name runs for every file of a scan.
+
+# Leading track numbers: "01 - ", "01. ", "1) ", "01_" and, with a leading zero only,
+# "01 " (a bare "50 " could be part of the artist, as in "50 Cent"). "112 - Title" is
+# only a track number if another " - " follows (see split_track_number).
+_TRACK_NUMBER = re.compile(r"^\s*(?:(\d{1,3})\s*(?:[.)_]|(?P<dash>-)(?!\d))\s*|(0\d{1,2})\s+)")
+
+# A catalog number: upper-case letters (digits allowed after the first), an optional
+# separator and a number, with an optional suffix: DKMNTL045, KOM 123, WARP-1, BAR12X.
+_CATNO = r"[A-Z][A-Z0-9]*?[A-Z]{1,}[\s.\-]?\d{1,6}[A-Z]{0,2}"
+
+# A bracketed catalog number, optionally preceded by the label:
+# "[DEKMANTEL045]", "(Dekmantel DKMNTL045)", "(Label CAT123)".
+_BRACKETED_CATNO = re.compile(
+    r"\s*[\(\[]\s*(?:(?P<label>[^\(\)\[\]]*?[^\W\d_][^\(\)\[\]]*?)\s+)?(?P<catno>" + _CATNO + r")\s*[\)\]]"
+)
+
+# Upper-case words that look like a catalog number prefix but describe the record
+# (format, part, country of the pressing, "MK2" version).
+_NOT_CATNO_PREFIXES = {"CD", "LP", "EP", "VOL", "PT", "PART", "DISC", "MIX", "TRACK", "MP", "VIP", "BPM",
+                       "UK", "US", "EU", "JP", "DE", "FR", "MK"}
+
+# A year after a space, as in "(HDB 2007)", dates the release rather than numbering it.
+_YEAR_NUMBER = re.compile(r"\s(?:19|20)\d\d$")
+
+# "(Someone Remix)", "[Someone Re-Edit]"; version descriptors such as "(Original Mix)" are not credits.
+_REMIX = re.compile(
+    r"[\(\[]\s*(?P<remixer>[^\(\)\[\]]+?)\s+(?:remix|rmx|re-?edit|rework|edit|mix|dub|version|vip)\s*[\)\]]",
+    re.IGNORECASE,
+)
+_VERSION_WORDS = re.compile(
+    r"^(?:original|extended|radio|album|single|main|clean|dirty|club|dub|instrumental|vocal|short|long|12\"?|7\"?)$",
+    re.IGNORECASE,
+)
+
+# "feat. Someone", "ft Someone", "(featuring Someone)".
+_FEATURING = re.compile(r"\b(?:feat|ft|featuring)\b\.?\s+(?P<featuring>[^\(\)\[\]]+?)\s*(?=[\)\]]|$)", re.IGNORECASE)
+
+_SPACES = re.compile(r"\s{2,}")
+
+PARSED_FIELDS = ("artist", "title", "tracknumber", "catno", "label", "remixer", "featuring")
+
+
+def normalize_catno(catno):
+    """Reduces a catalog number to a comparable form: "dkmntl 045" and "DKMNTL-045" become "DKMNTL045"."""
+    return re.sub(r"[\s.\-_]", "", catno or "").upper()
+
+
+def find_catno(text):
+    """
+    Finds a bracketed catalog number in text. Returns (catno, label, text without
+    it); catno and label are None if there is none.
+    """
+    for match in _BRACKETED_CATNO.finditer(text or ""):
+        catno = match.group("catno")
+        prefix = re.match(r"[A-Z]+", catno).group()
+        if prefix in _NOT_CATNO_PREFIXES or _YEAR_NUMBER.search(catno):
+            continue
+        label = match.group("label")
+        rest = _SPACES.sub(" ", text[:match.start()] + " " + text[match.end():]).strip()
+        return catno, label.strip() if label else None, rest
+    return None, None, text
+
+
+def parse_credits(text):
+    """Returns (remixer, featured artists) credited in a title or artist name; None where absent."""
+    remixer = None
+    for match in _REMIX.finditer(text or ""):
+        candidate = match.group("remixer").strip()
+        if not all(_VERSION_WORDS.match(word) for word in candidate.split()):
+            remixer = candidate
+            break
+    featuring = _FEATURING.search(text or "")
+    return remixer, featuring.group("featuring").strip() if featuring else None
+
+
+def split_track_number(name):
+    """Returns (track number, rest of name), or (None, name) if name does not start with a track number."""
+    number = _TRACK_NUMBER.match(name)
+    # Only a prefix: a name that is nothing but a number is a title.
+    if not number or not name[number.end():].strip():
+        return None, name
+    digits = number.group(1) or number.group(3)
+    rest = name[number.end():]
+    # "112 - Only You" is an artist and a title; "01 - Only You" and "112 - Artist - Title" are numbered.
+    if number.group("dash") and not digits.startswith("0") and " - " not in rest:
+        return None, name
+    return int(digits), rest
+
+
+def parse_name(file_name):
+    """
+    Parses a file name (without extension) such as "01 - Artist - Title (Label CAT123)"
+    or "[DEKMANTEL045] Artist - Title (Someone Remix)".
+
+    Returns a dictionary with the keys of PARSED_FIELDS (None when not found).
+    Artist and title are split on the first " - " once the track number and the
+    catalog number have been removed; both are None if there is no " - ".
+    """
+    fields = dict.fromkeys(PARSED_FIELDS)
+    name = file_name
+
+    fields["tracknumber"], name = split_track_number(name)
+
+    fields["catno"], fields["label"], name = find_catno(name)
+
+    if " - " in name:
+        artist, title = (part.strip() for part in name.split(" - ", 1))
+        if artist and title:
+            fields["artist"], fields["title"] = artist, title
+            fields["remixer"], fields["featuring"] = parse_credits(title)
+            if fields["featuring"] is None:
+                _, fields["featuring"] = parse_credits(artist)
+    return fields
@@ -1,19 +1,77 @@
 # organizer.py
 import os
-import shutil
+import threading
 import time
-from discogs_utils import fetch_release_info
+from catalog import DEFAULT_LAYOUT, format_layout
+from dedup import Deduplicator, DUPLICATE_POLICIES, DUPLICATES_FOLDER
+from discogs_utils import OfflineMiss, lookup_album, lookup_tags, release_by_id
+from file_ops import FileOps
+from grouping import DIRECTORY_DONE, AlbumGrouper
+import instrumentation
+from journal import DECIDED, file_identity
+from pipeline import Pipeline, Stage
+from rate_limiter import count_api_calls
+from scanner import PathEntry, mark_output_dir, scan_audio_files
+from tag_reader import TagReaderPool, write_release_tags
 
-def organize_files(discogs_client, folder, action, log_callback=None, progress_callback=None):
+ACTIONS = ("move", "copy")
+
+def organize_files(discogs_client, folder, action, log_callback=None, progress_callback=None,
+                   tag_workers=None, lookup_workers=4, io_workers=4, local_index=None, journal=None,
+                   duplicates="folder", copies_per_device=2, dry_run=False, result_callback=None,
+                   metrics=None, paths=None, catalog=None, layout=DEFAULT_LAYOUT, write_tags=False):
     """
     Organizes music files in the given folder using the provided Discogs client.
-    
+
+    The folder is scanned recursively (skipping the organized output) and files
+    flow through a pipeline of stages that run at the same time, starting as soon
+    as the first file is found:
+    tag reading -> duplicate detection -> album grouping -> Discogs lookup -> move/copy. Each stage has
+    its own worker threads and a bounded queue in front of it, so local work
+    overlaps with network latency. The lookup stage is additionally paced by the
+    client's rate limiter. Tracks from the same record are looked up together,
+    with a single release match for the whole group.
+
     Parameters:
       - discogs_client: A properly initialized Discogs client.
       - folder: The directory containing the music files.
       - action: "move" or "copy" files into organized subfolders.
       - log_callback: (Optional) A function that receives log messages.
       - progress_callback: (Optional) A function that receives progress updates as (current, total).
+                           total is the number of files found so far and grows while the scan runs.
+      - tag_workers: (Optional) Number of processes reading tags (default: one per CPU;
+                     0 reads tags in threads of this process).
+      - lookup_workers / io_workers: (Optional) Threads per stage.
+      - copies_per_device: (Optional) Maximum number of files copied onto the same
+                           device at a time (see FileOps).
+      - local_index: (Optional) LocalIndex of the Discogs data dump, searched before the API.
+      - journal: (Optional) Journal that records every decision and completed file
+                 operation. With a journal, a re-run skips files that were already
+                 organized and replays decided but unfinished operations without
+                 another lookup.
+      - duplicates: (Optional) What to do with files whose content is identical to a file
+                    seen earlier in the run. They are never looked up; they reuse the
+                    first copy's match. "skip" leaves them where they are, "hardlink"
+                    places them next to the first copy as hard links, "folder" (default)
+                    moves/copies them into the "Duplicates" folder. None disables the check.
+      - dry_run: (Optional) Look everything up and report where each file would go, but
+                 do not move, copy or link anything. The journal is not used.
+      - result_callback: (Optional) A function that receives one dictionary per file with
+                         the keys "path", "status" ("organized", "planned", "duplicate",
+                         "skipped", "missing" or "error"), "dest", "release" (the release
+                         info or None) and "api_calls".
+      - metrics: (Optional) An instrumentation.Metrics that receives timing spans and
+                 counters of every stage (tag reading, lookups, API requests, cache
+                 hits, rate-limiter waits, match scores, file operations).
+      - paths: (Optional) Process only these files instead of scanning folder (e.g. new
+               files reported by the folder watcher). Output still goes below folder.
+      - catalog: (Optional) Catalog in which every organized file is recorded with its
+                 release (ID, score and fields), for later queries and re-layouts.
+      - layout: (Optional) Folder template for matched files, relative to folder
+                (default: "{Label}/{Catalog Number} - {Artist} - {Title} - {Year}").
+      - write_tags: (Optional) Store the matched Discogs release ID and track position in
+                    the tags of every organized file, so that later runs (on any machine)
+                    load the release by its ID instead of searching for it again.
     """
     def log(msg):
         if log_callback:
@@ -21,66 +79,424 @@ def organize_files(discogs_client, folder, action, log_callback=None, progress_c
         else:
             print(msg)
 
-    # Collect audio files (case-insensitive extension matching).
-    files = [f for f in os.listdir(folder) if f.lower().endswith((".mp3", ".flac", ".wav", ".m4a", ".aiff"))]
-    total_files = len(files)
-    if total_files == 0:
-        log("No audio files found in the selected folder.")
-        return
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    if duplicates is not None and duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy: {duplicates}")
+    format_layout(layout, {})  # Raises ValueError for a layout that leads out of folder.
+
+    if dry_run:
+        journal = None  # Nothing is carried out, so nothing may be recorded as decided.
+        catalog = None
 
+    folder = os.path.abspath(folder)
     not_categorized_folder = os.path.join(folder, "Not categorized")
-    os.makedirs(not_categorized_folder, exist_ok=True)
+    duplicates_folder = os.path.join(folder, DUPLICATES_FOLDER)
+    # Top-level output folders (labels) this run creates; the scanner does not descend into
+    # them, and they are marked on disk so that later runs skip them as well. A folder
+    # that existed before may hold files to organize and is left alone.
+    output_dirs = set()
+    marked_dirs = set()
+    output_lock = threading.Lock()
+    # Paths in the Duplicates folder handed out during this run (see duplicate_dest).
+    duplicate_dests = set()
 
-    missing_count = 0
     max_attempts = 3
+    state = {"found": 0, "done": 0, "missing": 0, "api_calls": 0, "skipped": 0, "replayed": 0, "offline": 0}
+    state_lock = threading.Lock()
+
+    if journal is not None:
+        # Moves interrupted after the file reached its destination but before the
+        # journal was updated: the source is gone, so the scan will not see them.
+        for path, pending_action, dest in journal.pending(folder):
+            if pending_action == "move" and not os.path.exists(path) and dest and os.path.exists(dest):
+                journal.record_done(path, dest, file_identity(os.stat(dest)))
+                log(f"Recovered interrupted move: {os.path.basename(path)}")
+
+    # Files of each scanned directory that have not passed the tag stage yet, and the
+    # directories the scan has left. Once both say a directory is finished, a
+    # DIRECTORY_DONE marker tells the group stage that its groups are complete.
+    dir_pending = {}
+    dirs_scanned = set()
+    # Position of every scanned directory in scan order, carried by its marker.
+    dir_index = {}
+
+    def discover():
+        # Audio files are handed to the pipeline as the scan finds them.
+        if paths is not None:
+            for entry in (PathEntry(os.path.abspath(path)) for path in paths):
+                with state_lock:
+                    state["found"] += 1
+                yield entry
+            return
+        current = None
+        for entry in scan_audio_files(folder, skip_dirs=output_dirs, skip_names=("Not categorized", DUPLICATES_FOLDER)):
+            directory = os.path.dirname(entry.path)
+            if directory != current:
+                # The scan yields the files of a directory together; current is finished.
+                if current is not None and leave_directory(current):
+                    yield directory_done(current)
+                current = directory
+            with state_lock:
+                state["found"] += 1
+                dir_pending[directory] = dir_pending.get(directory, 0) + 1
+                dir_index.setdefault(directory, len(dir_index))
+            yield entry
+        if current is not None and leave_directory(current):
+            yield directory_done(current)
+
+    def directory_done(directory):
+        return {DIRECTORY_DONE: directory, "index": dir_index[directory]}
+
+    def leave_directory(directory):
+        """Records that the scan has left directory; True if all of its files have been read already."""
+        with state_lock:
+            dirs_scanned.add(directory)
+            return dir_pending.get(directory, 0) == 0
+
+    def entry_read(directory):
+        """Records that a file of directory has been read; True if it was the last one."""
+        with state_lock:
+            dir_pending[directory] -= 1
+            return dir_pending[directory] == 0 and directory in dirs_scanned
 
-    for i, file in enumerate(files):
-        file_path = os.path.join(folder, file)
+    def advance(msg=None, item=None, status=None, dest=None):
+        # Progress is reported from several worker threads; keep the count consistent.
+        with state_lock:
+            state["done"] += 1
+            done, total_files = state["done"], state["found"]
+        if msg:
+            log(f"{msg} ({done}/{total_files})")
+        if progress_callback:
+            progress_callback(done, total_files)
+        if result_callback and item is not None:
+            result_callback({
+                "path": item["path"],
+                "status": status,
+                "dest": dest,
+                "release": item.get("release_info"),
+                "api_calls": item.get("api_calls", 0),
+            })
+
+    def read_stage(entry, emit):
+        if isinstance(entry, dict):
+            emit(entry)  # A DIRECTORY_DONE marker from the scan.
+            return
+        if paths is not None:
+            read_entry(entry, emit)
+            return
+        directory = os.path.dirname(entry.path)
+        try:
+            read_entry(entry, emit)
+        finally:
+            # Sent by the thread that read the directory's last file, after that file.
+            if entry_read(directory):
+                emit(directory_done(directory))
+
+    def read_entry(entry, emit):
+        file = entry.name
+        file_path = entry.path
         attempt = 0
         while attempt < max_attempts and not os.path.exists(file_path):
             if attempt == 0:
                 log(f"File not found, trying again: {file} (attempt {attempt+1})")
             else:
                 log(f"File still not found, trying again: {file} (attempt {attempt+1})")
-            time.sleep(1)  # Wait 1 second before retrying.
+            with instrumentation.span("tags.missing_file_wait"):
+                time.sleep(1)  # Wait 1 second before retrying.
             attempt += 1
 
         if not os.path.exists(file_path):
             log(f"File not found after {max_attempts} attempts: {file}")
-            missing_count += 1
-            if progress_callback:
-                progress_callback(i+1, total_files)
-            continue
+            with state_lock:
+                state["missing"] += 1
+            advance(item={"path": file_path}, status="missing")
+            return
+
+        stat = entry.stat()
+        item = {"file": file, "path": file_path, "size": stat.st_size}
+        if journal is not None:
+            item["identity"] = file_identity(stat)
+            entry_state = journal.get(file_path, item["identity"])
+            if entry_state is not None and entry_state["state"] != DECIDED:
+                # Organized by an earlier run (or written by one); nothing to do.
+                with state_lock:
+                    state["skipped"] += 1
+                advance(item=item, status="skipped")
+                return
+            if entry_state is not None and entry_state["action"] == action:
+                # Decided by an earlier run that stopped before the file operation.
+                item.update(release_info=entry_state["release_info"], dest=entry_state["dest"], api_calls=0)
+                with state_lock:
+                    state["replayed"] += 1
+                emit(item)
+                return
+
+        file_name, _ = os.path.splitext(file)
+        try:
+            with instrumentation.span("tags.read"):
+                tags = tag_pool.read(file_path, file_name)
+        except Exception as e:
+            log(f"Error reading tags of {file}: {e}")
+            tags = {}
+        item.update(name=file_name, tags=tags)
+        emit(item)
+
+    def decide(item, release_info, api_calls, emit):
+        """
+        Chooses the destination of a looked-up file, commits it to the journal and
+        emits the file, followed by the duplicates that waited for its decision.
+        """
+        file = item["file"]
+        if release_info:
+            release_folder = format_layout(layout, release_info)
+            if not dry_run:
+                top = os.path.join(folder, release_folder.split(os.sep)[0])
+                with output_lock:
+                    if top not in output_dirs and not os.path.isdir(top):
+                        output_dirs.add(top)  # Created by this run (the file stage makes it).
+            dest = os.path.join(folder, release_folder, file)
+        else:
+            dest = os.path.join(not_categorized_folder, file)
+        item.update(release_info=release_info, dest=dest, api_calls=api_calls)
+        if deduplicator is not None:
+            item["placed"] = threading.Event()  # Set by the file stage; duplicates may link to dest.
+        if journal is not None:
+            journal.record_decision(item["path"], item["identity"], action, dest, release_info)
+        # The deduplicator learns dest before the file stage can move the file there.
+        ready = deduplicator.resolve(item) if deduplicator is not None else []
+        emit(item)
+        for duplicate in ready:
+            emit(duplicate)
+
+    def lookup_by_id(release_id, track_position=None):
+        try:
+            return release_by_id(discogs_client, release_id, track_position, local_index=local_index)
+        except Exception as e:
+            log(f"Error fetching release {release_id}: {e}")
+            return None
+
+    def lookup_track(item):
+        try:
+            return lookup_tags(discogs_client, item["tags"], local_index=local_index)
+        except OfflineMiss:
+            log(f"Not found (offline): {item['file']}")
+            with state_lock:
+                state["offline"] += 1
+        except Exception as e:
+            log(f"Error fetching release info for {item['file']}: {e}")
+        return None
+
+    def lookup_stage(item, emit):
+        if "dest" in item:
+            emit(item)  # Replayed from the journal.
+            return
+        if "members" not in item:
+            with count_api_calls() as calls:
+                release_info = lookup_track(item)
+            with state_lock:
+                state["api_calls"] += calls.count
+            decide(item, release_info, calls.count, emit)
+            return
+
+        # A group of tracks from one record: one lookup for all of them.
+        members = item["members"]
+        release_ids = {member["tags"].get("discogs_release_id") for member in members}
+        if len(release_ids) == 1 and None not in release_ids:
+            # Every track is tagged with the same release: load it once by its ID.
+            with count_api_calls() as calls:
+                release_info = lookup_by_id(release_ids.pop())
+            with state_lock:
+                state["api_calls"] += calls.count
+            if release_info is not None:
+                for n, member in enumerate(members):
+                    member_info = dict(release_info, **{"Track Position": member["tags"].get("discogs_track_position")})
+                    decide(member, member_info, calls.count if n == 0 else 0, emit)
+                return
 
+        # A catalog number only identifies the record if all tracks that have one agree.
+        catnos = {member["tags"].get("catno") for member in members} - {None}
+        catno = catnos.pop() if len(catnos) == 1 else None
+        with count_api_calls() as calls:
+            try:
+                release_info = lookup_album(discogs_client, item["artist"], item["album"], item["titles"],
+                                            local_index=local_index, catno=catno)
+            except OfflineMiss:
+                release_info = None  # Each track is looked up (and reported) on its own below.
+            except Exception as e:
+                log(f"Error fetching release info for {item['artist']} - {item['album']}: {e}")
+                release_info = None
+        with state_lock:
+            state["api_calls"] += calls.count
+        if release_info is None:
+            # No release for the group as a whole; fall back to one lookup per track.
+            log(f"No release found for {item['artist']} - {item['album']}, looking up {len(members)} tracks separately")
+            for member in members:
+                lookup_stage(member, emit)
+            return
+
+        log(f"Matched {len(members)} tracks of {item['artist']} - {item['album']} with one lookup")
+        positions = release_info.pop("Track Positions")
+        for n, member in enumerate(members):
+            member_info = dict(release_info, **{"Track Position": positions[n]})
+            decide(member, member_info, calls.count if n == 0 else 0, emit)
+
+    def mark_output(dest):
+        """
+        Marks the top-level folder below folder that dest is written to (see
+        scanner.OUTPUT_MARKER), if this run created it.
+        """
+        top = os.path.join(folder, os.path.relpath(dest, folder).split(os.sep)[0])
+        with output_lock:
+            if top in marked_dirs or top not in output_dirs:
+                return
+            mark_output_dir(top)
+            marked_dirs.add(top)
+
+    def tag_file(item, dest):
+        """Writes the matched release ID into the tags of a placed file (write_tags)."""
+        release_info = item["release_info"]
+        if write_tags and release_info and release_info.get("Release ID"):
+            try:
+                write_release_tags(dest, release_info["Release ID"], release_info.get("Track Position"))
+            except Exception as e:
+                log(f"Could not write the release ID to the tags of {item['file']}: {e}")
+
+    def link_duplicate(item):
+        """Hard-links a duplicate next to its original's destination. Returns the link, or None."""
+        original = item["duplicate_of"]
+        original["placed"].wait()
+        dest = os.path.join(os.path.dirname(original["dest"]), item["file"])
+        if not os.path.exists(original["dest"]) or os.path.exists(dest):
+            return None
+        if journal is not None:
+            journal.record_decision(item["path"], item["identity"], action, dest, item["release_info"])
         try:
-            file_name, _ = os.path.splitext(file)
-            release_info = fetch_release_info(discogs_client, file_path, file_name)
-            if release_info:
-                folder_structure = os.path.join(
-                    folder,
-                    release_info.get("Label", "Unknown Label"),
-                    f"{release_info.get('Catalog Number', 'Unknown')} - {release_info.get('Artist', 'Unknown')} - {release_info.get('Title', 'Unknown')} - {release_info.get('Year', 'Unknown')}",
-                )
-                os.makedirs(folder_structure, exist_ok=True)
-                dest = os.path.join(folder_structure, file)
+            os.link(original["dest"], dest)
+        except OSError:
+            return None  # E.g. another file system; fall back to the duplicates folder.
+        if action == "move":
+            os.remove(item["path"])
+        return dest
+
+    def duplicate_dest(file):
+        """
+        Returns a path in the Duplicates folder that is neither taken nor handed out
+        before in this run: "Track.mp3", else "Track (2).mp3", "Track (3).mp3", ...
+        Copies of different files may share a name; none may replace another.
+        """
+        stem, extension = os.path.splitext(file)
+        dest = os.path.join(duplicates_folder, file)
+        with state_lock:
+            n = 1
+            while dest in duplicate_dests or os.path.lexists(dest):
+                n += 1
+                dest = os.path.join(duplicates_folder, f"{stem} ({n}){extension}")
+            duplicate_dests.add(dest)
+        return dest
+
+    def duplicate_stage(item):
+        file = item["file"]
+        original = os.path.basename(item["duplicate_of"]["path"])
+        if duplicates == "skip":
+            if journal is not None:
+                journal.record_skipped(item["path"], item["identity"])
+            advance(f"Duplicate of {original}, left in place: {file}", item, "duplicate")
+            return
+        if dry_run:
+            advance(f"Duplicate of {original}: {file}", item, "duplicate")
+            return
+        dest = link_duplicate(item) if duplicates == "hardlink" else None
+        linked = dest is not None
+        if dest is None:
+            dest = duplicate_dest(file)
+            if journal is not None:
+                journal.record_decision(item["path"], item["identity"], action, dest, item["release_info"])
+            mark_output(dest)
+            if action == "move":
+                file_ops.move(item["path"], dest)
             else:
-                dest = os.path.join(not_categorized_folder, file)
-            
+                file_ops.copy(item["path"], dest)
+            tag_file(item, dest)
+        if journal is not None:
+            journal.record_done(item["path"], dest, file_identity(os.stat(dest)))
+        # Only links sit in a release folder; the Duplicates folder is not part of the catalog.
+        if catalog is not None and linked and item["release_info"]:
+            catalog.record(dest, item["release_info"])
+        advance(f"Duplicate of {original}: {file} -> {os.path.relpath(dest, folder)}", item, "duplicate", dest)
+
+    def file_stage(item, emit):
+        file = item["file"]
+        dest = item["dest"]
+        try:
+            if "duplicate_of" in item:
+                duplicate_stage(item)
+                return
+
+            if dry_run:
+                advance(f"Would {action}: {file} -> {os.path.relpath(dest, folder)} [{item['api_calls']} API calls]",
+                        item, "planned", dest)
+                return
+            mark_output(dest)
             if action == "move":
-                shutil.move(file_path, dest)
-            elif action == "copy":
-                shutil.copy(file_path, dest)
+                file_ops.move(item["path"], dest)
             else:
-                log(f"Unknown action '{action}' for file: {file}")
-                continue
+                # Written under a temporary name first; an interrupted copy never looks complete.
+                file_ops.copy(item["path"], dest)
+
+            tag_file(item, dest)
+            if journal is not None:
+                journal.record_done(item["path"], dest, file_identity(os.stat(dest)))
+            if catalog is not None and item["release_info"]:
+                catalog.record(dest, item["release_info"])
 
-            log(f"Processed: {file} ({i+1}/{total_files})")
-            if progress_callback:
-                progress_callback(i+1, total_files)
+            advance(f"Processed: {file} [{item['api_calls']} API calls]", item, "organized", dest)
         except Exception as e:
             log(f"Error processing {file}: {e}")
-        # Pause briefly to help avoid hitting Discogs API rate limits.
-        time.sleep(2)
+            advance(item=item, status="error", dest=dest)
+        finally:
+            if "placed" in item:
+                item["placed"].set()
+
+    grouper = AlbumGrouper()
+    file_ops = FileOps(per_device=copies_per_device)
+    # Scans send a DIRECTORY_DONE marker after each directory, so copies are checked in scan order.
+    deduplicator = Deduplicator(by_directory=paths is None) if duplicates is not None else None
+    tag_pool = TagReaderPool(tag_workers)
+    # Tag stage threads mostly wait on the worker processes; one per process keeps them busy.
+    tag_threads = tag_pool.processes or 4
+
+    def on_error(stage, item, exc):
+        log(f"Error in {stage.name} stage: {exc}")
+
+    try:
+        with instrumentation.collect(metrics), instrumentation.span("organize_files"):
+            Pipeline([
+                Stage("tags", read_stage, workers=tag_threads),
+                *([Stage("dedup", deduplicator.add, flush=deduplicator.flush)] if deduplicator is not None else []),
+                Stage("group", grouper.add, flush=grouper.flush),
+                Stage("lookup", lookup_stage, workers=lookup_workers),
+                Stage("files", file_stage, workers=io_workers),
+            ], on_error=on_error).run(discover())
+    finally:
+        tag_pool.close()
+
+    if state["found"] == 0:
+        log("No audio files found in the selected folder.")
+        return
 
     log("Organization complete!")
-    log(f"Total files not found: {missing_count}")
\ No newline at end of file
+    log(f"Total files not found: {state['missing']}")
+    if state["offline"]:
+        log(f"Not found in the offline cache: {state['offline']}")
+    if deduplicator is not None:
+        log(f"Duplicates found: {deduplicator.duplicates}")
+    if journal is not None:
+        log(f"Already organized: {state['skipped']}, resumed from the journal: {state['replayed']}")
+    log(f"Total Discogs API calls: {state['api_calls']}")
+    if metrics is not None:
+        spans = metrics.summary()["spans"]
+        stage_times = ", ".join(
+            f"{name[len('stage.'):]} {span['total_seconds']:.1f}s" for name, span in spans.items() if name.startswith("stage.")
+        )
+        log(f"Time per stage (summed over workers): {stage_times}")
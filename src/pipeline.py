@@ -0,0 +1,99 @@
+# pipeline.py
+import contextvars
+import queue
+import threading
+import instrumentation
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline.
+
+    Parameters:
+      - name: Used in error reports.
+      - func: Called as func(item, emit) for every input item; calls emit(result) for
+              each item it wants to hand to the next stage (zero, one or several times).
+      - workers: Number of threads running func concurrently.
+      - flush: (Optional) Called once as flush(emit) after the last item went through
+               func, for stages that hold items back (e.g. to group them).
+      - maxsize: Capacity of the queue feeding this stage; a full queue blocks the
+                 stage before it, so a fast stage can never run far ahead of a slow one.
+    """
+
+    def __init__(self, name, func, workers=1, flush=None, maxsize=64):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.flush = flush
+        self.inbox = queue.Queue(maxsize=maxsize)
+        self._running = workers
+        self._lock = threading.Lock()
+
+
+class Pipeline:
+    """
+    Runs items through a chain of Stages, each with its own worker threads and a
+    bounded queue in front of it, so all stages work at the same time.
+
+    on_error(stage, item, exc) is called when a stage function raises; the item is dropped.
+    """
+
+    def __init__(self, stages, on_error=None):
+        self.stages = stages
+        self.on_error = on_error
+
+    def run(self, source):
+        """Feeds every item of source into the first stage and blocks until all stages are done."""
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                # Each worker runs in a copy of the caller's context, so context-bound state
+                # (API call counters, active metrics) reaches the stage functions.
+                context = contextvars.copy_context()
+                thread = threading.Thread(target=context.run, args=(self._work, index), name=f"{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        try:
+            for item in source:
+                first.inbox.put(item)
+        finally:
+            for _ in range(first.workers):
+                first.inbox.put(_DONE)
+            for thread in threads:
+                thread.join()
+
+    def _work(self, index):
+        stage = self.stages[index]
+        nxt = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        emit = nxt.inbox.put if nxt else (lambda item: None)
+
+        while True:
+            item = stage.inbox.get()
+            if item is _DONE:
+                break
+            try:
+                # Includes time spent blocked handing results to a full next stage.
+                with instrumentation.span(f"stage.{stage.name}"):
+                    stage.func(item, emit)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(stage, item, e)
+
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last:
+            # The last worker of a stage flushes it and shuts the next stage down.
+            if stage.flush:
+                try:
+                    stage.flush(emit)
+                except Exception as e:
+                    if self.on_error:
+                        self.on_error(stage, None, e)
+            if nxt:
+                for _ in range(nxt.workers):
+                    nxt.inbox.put(_DONE)
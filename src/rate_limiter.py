@@ -0,0 +1,156 @@
+# rate_limiter.py
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from discogs_client.fetchers import Fetcher
+import instrumentation
+
+AUTHENTICATED_LIMIT = 60  # Discogs allows 60 requests per minute with a token (25 without).
+
+_api_call_counter = contextvars.ContextVar("api_call_counter", default=None)
+
+
+class ApiCallCounter:
+    """Number of HTTP requests sent to Discogs while a count_api_calls() block was active."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+@contextmanager
+def count_api_calls():
+    """
+    Counts the Discogs requests made by the code inside the with-block, including
+    work it hands to other threads through contextvars.copy_context().run.
+    """
+    counter = ApiCallCounter()
+    token = _api_call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _api_call_counter.reset(token)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request made to the Discogs API.
+
+    The bucket refills at limit/60 tokens per second and is kept in sync with the
+    X-Discogs-Ratelimit* headers of each response, so the budget used by other
+    clients of the same token is taken into account as well.
+
+    Parameters:
+      - limit: Requests allowed per minute until the server reports its own value.
+      - max_retries: How often a request is retried after an HTTP 429.
+      - base_backoff / max_backoff: Bounds (seconds) for the jittered exponential backoff after a 429.
+    """
+
+    def __init__(self, limit=AUTHENTICATED_LIMIT, max_retries=5, base_backoff=2.0, max_backoff=60.0):
+        self.limit = limit
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.requests_made = 0
+        self.retries = 0
+        self.time_slept = 0.0
+        self._tokens = float(limit)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent and returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests_made += 1
+                    self.time_slept += waited
+                    if waited:
+                        instrumentation.incr("rate_limiter.wait_seconds", waited)
+                    return waited
+                delay = (1 - self._tokens) * 60.0 / self.limit
+            time.sleep(delay)
+            waited += delay
+
+    def update_from_headers(self, headers):
+        """Adjusts the bucket to the rate-limit state reported by Discogs."""
+        try:
+            limit = int(headers.get("X-Discogs-Ratelimit", self.limit))
+            remaining = headers.get("X-Discogs-Ratelimit-Remaining")
+            if remaining is None and "X-Discogs-Ratelimit-Used" in headers:
+                remaining = limit - int(headers["X-Discogs-Ratelimit-Used"])
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._refill()
+            if limit > 0:
+                self.limit = limit
+            if remaining is not None:
+                self._tokens = min(self._tokens, max(int(remaining), 0))
+
+    def backoff(self, attempt):
+        """Sleeps after an HTTP 429, using exponential backoff with full jitter."""
+        with self._lock:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+            self.retries += 1
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        time.sleep(delay)
+        with self._lock:
+            self.time_slept += delay
+        instrumentation.incr("api.retries")
+        instrumentation.incr("rate_limiter.backoff_seconds", delay)
+        return delay
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.limit), self._tokens + (now - self._updated) * self.limit / 60.0)
+        self._updated = now
+
+
+class RateLimitedFetcher(Fetcher):
+    """
+    Sends Discogs requests over HTTP, waiting on a RateLimiter before each one and
+    retrying with backoff when the server answers 429 (Too Many Requests).
+
+    http is anything with the requests.request() signature (the requests module or a
+    Session); create_discogs_client passes a pooled session from http_transport.
+    """
+
+    def __init__(self, user_token=None, limiter=None, http=requests):
+        self.user_token = user_token
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.http = http
+
+    def fetch(self, client, method, url, data=None, headers=None, json=True):
+        content, status_code, _ = self.fetch_with_headers(client, method, url, data, headers, json)
+        return content, status_code
+
+    def fetch_with_headers(self, client, method, url, data=None, headers=None, json=True):
+        """Like fetch, but also returns the response headers (used for ETag/Last-Modified)."""
+        params = {"token": self.user_token} if self.user_token else None
+        counter = _api_call_counter.get()
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            if counter is not None:
+                counter.increment()
+            with instrumentation.span("api.request"):
+                resp = self.http.request(method, url, params=params, data=data, headers=headers)
+            instrumentation.incr("api.calls")
+            self.limiter.update_from_headers(resp.headers)
+            if resp.status_code == 429 and attempt < self.limiter.max_retries:
+                self.limiter.backoff(attempt)
+                attempt += 1
+                continue
+            return resp.content, resp.status_code, resp.headers
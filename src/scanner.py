@@ -0,0 +1,86 @@
+# scanner.py
+import os
+from tag_reader import AUDIO_EXTENSIONS
+
+# Empty file placed in every top-level folder the organizer writes to (e.g. a label
+# folder), so later scans of the same folder skip the organized output.
+OUTPUT_MARKER = ".musicorganizer-output"
+
+
+def mark_output_dir(path):
+    """Creates path if needed and marks it as organized output (see OUTPUT_MARKER)."""
+    os.makedirs(path, exist_ok=True)
+    marker = os.path.join(path, OUTPUT_MARKER)
+    if not os.path.exists(marker):
+        open(marker, "a").close()
+
+
+def is_output_dir(path):
+    return os.path.exists(os.path.join(path, OUTPUT_MARKER))
+
+
+class PathEntry:
+    """
+    Stands in for an os.DirEntry of a single file that was not found by a scan
+    (e.g. reported by the folder watcher). Offers the same name, path and stat().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def scan_audio_files(folder, skip_dirs=(), skip_names=("Not categorized",), extensions=AUDIO_EXTENSIONS):
+    """
+    Walks folder recursively with os.scandir and yields a DirEntry for every audio
+    file as soon as it is found, so processing can start before the walk is done.
+
+    Parameters:
+      - folder: The directory to scan.
+      - skip_dirs: Paths of directories not to descend into. It is checked whenever a
+                   directory is reached, so callers can keep adding to it (e.g. the
+                   label folders created while organizing) during the scan.
+      - skip_names: Directory names that are never descended into.
+      - extensions: Lowercase file extensions to yield.
+
+    Directories marked as organized output (see mark_output_dir) are skipped as
+    well, unless folder itself is one.
+
+    Only the directories still to be visited are kept in memory. The files of a
+    directory are yielded together, once it has been listed. The DirEntry objects
+    cache their stat() results, so later stages get size and mtime without another
+    system call.
+    """
+    pending = [folder]
+    while pending:
+        directory = pending.pop()
+        if directory != folder and (os.path.basename(directory) in skip_names or directory in skip_dirs):
+            continue
+        subdirs = []
+        files = []
+        marked = False
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name == OUTPUT_MARKER:
+                            marked = True
+                        elif entry.is_file() and entry.name.lower().endswith(extensions):
+                            files.append(entry)
+                    except OSError:
+                        continue  # Entry vanished or is unreadable; skip it.
+        except OSError:
+            continue  # Directory vanished or cannot be listed.
+        if marked and directory != folder:
+            continue  # Organized output of an earlier run.
+        yield from files
+        # Sorted in reverse so that pop() visits subdirectories in name order.
+        pending.extend(sorted(subdirs, reverse=True))
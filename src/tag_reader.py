@@ -0,0 +1,309 @@
+# tag_reader.py
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from mutagen import File as MutagenFile, MutagenError
+from mutagen.aiff import AIFF
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3, ID3NoHeaderError, TXXX
+from mutagen.mp4 import MP4, MP4FreeForm
+from mutagen.wave import WAVE
+from name_parser import find_catno, parse_credits, parse_name
+
+TAG_FIELDS = ("artist", "title", "album", "albumartist", "tracknumber", "tracktotal", "discnumber",
+              "catno", "label", "isrc", "discogs_release_id", "discogs_track_position")
+
+# Names of the tags in which the organizer stores its match (see write_release_tags):
+# ID3 TXXX descriptions, Vorbis comment keys (lower case) and MP4 freeform atom names.
+RELEASE_ID_TAG = "DISCOGS_RELEASE_ID"
+TRACK_POSITION_TAG = "DISCOGS_TRACK_POSITION"
+_MP4_FREEFORM = "----:com.apple.iTunes:"
+
+
+def _split_number(value):
+    """Splits numbers such as "3/12" into (3, 12)."""
+    number, _, total = str(value or "").partition("/")
+    number = int(number) if number.strip().isdigit() else None
+    total = int(total) if total.strip().isdigit() else None
+    return number, total
+
+
+def _id3_text(tags, key):
+    frame = tags.get(key)
+    if frame is not None and getattr(frame, "text", None):
+        return str(frame.text[0]).strip() or None
+    return None
+
+
+def _from_id3(tags):
+    # Used for MP3 and for the ID3 chunks of AIFF and WAV files.
+    fields = {
+        "artist": _id3_text(tags, "TPE1"),
+        "title": _id3_text(tags, "TIT2"),
+        "album": _id3_text(tags, "TALB"),
+        "albumartist": _id3_text(tags, "TPE2"),
+        "label": _id3_text(tags, "TPUB") or _id3_text(tags, "TXXX:LABEL"),
+        "catno": _id3_text(tags, "TXXX:CATALOGNUMBER") or _id3_text(tags, "TXXX:CATALOG NUMBER"),
+        "isrc": _id3_text(tags, "TSRC"),
+        "discogs_release_id": _id3_text(tags, f"TXXX:{RELEASE_ID_TAG}"),
+        "discogs_track_position": _id3_text(tags, f"TXXX:{TRACK_POSITION_TAG}"),
+    }
+    fields["tracknumber"], fields["tracktotal"] = _split_number(_id3_text(tags, "TRCK"))
+    fields["discnumber"], _ = _split_number(_id3_text(tags, "TPOS"))
+    return fields
+
+
+def _vorbis_text(tags, *keys):
+    for key in keys:
+        values = tags.get(key)
+        if values and values[0].strip():
+            return values[0].strip()
+    return None
+
+
+def _from_vorbis(tags):
+    fields = {
+        "artist": _vorbis_text(tags, "artist"),
+        "title": _vorbis_text(tags, "title"),
+        "album": _vorbis_text(tags, "album"),
+        "albumartist": _vorbis_text(tags, "albumartist", "album artist"),
+        "label": _vorbis_text(tags, "label", "organization", "publisher"),
+        "catno": _vorbis_text(tags, "catalognumber", "labelno", "catalog #"),
+        "isrc": _vorbis_text(tags, "isrc"),
+        "discogs_release_id": _vorbis_text(tags, RELEASE_ID_TAG.lower()),
+        "discogs_track_position": _vorbis_text(tags, TRACK_POSITION_TAG.lower()),
+    }
+    fields["tracknumber"], fields["tracktotal"] = _split_number(_vorbis_text(tags, "tracknumber"))
+    total = _vorbis_text(tags, "tracktotal", "totaltracks")
+    if total and total.isdigit():
+        fields["tracktotal"] = int(total)
+    fields["discnumber"], _ = _split_number(_vorbis_text(tags, "discnumber"))
+    return fields
+
+
+def _mp4_text(tags, key):
+    values = tags.get(key)
+    if not values:
+        return None
+    value = values[0]
+    if isinstance(value, bytes):  # Freeform "----:" atoms hold raw bytes.
+        value = value.decode("utf-8", "replace")
+    return str(value).strip() or None
+
+
+def _from_mp4(tags):
+    fields = {
+        "artist": _mp4_text(tags, "\xa9ART"),
+        "title": _mp4_text(tags, "\xa9nam"),
+        "album": _mp4_text(tags, "\xa9alb"),
+        "albumartist": _mp4_text(tags, "aART"),
+        "label": _mp4_text(tags, "----:com.apple.iTunes:LABEL"),
+        "catno": _mp4_text(tags, "----:com.apple.iTunes:CATALOGNUMBER"),
+        "isrc": _mp4_text(tags, "----:com.apple.iTunes:ISRC"),
+        "discogs_release_id": _mp4_text(tags, _MP4_FREEFORM + RELEASE_ID_TAG),
+        "discogs_track_position": _mp4_text(tags, _MP4_FREEFORM + TRACK_POSITION_TAG),
+        "tracknumber": None,
+        "tracktotal": None,
+        "discnumber": None,
+    }
+    if tags.get("trkn"):
+        fields["tracknumber"], fields["tracktotal"] = [n or None for n in tags["trkn"][0]]
+    if tags.get("disk"):
+        fields["discnumber"] = tags["disk"][0][0] or None
+    return fields
+
+
+def _load_id3(path):
+    try:
+        return ID3(path)  # Reads only the tag at the start (and end) of the file.
+    except ID3NoHeaderError:
+        return None
+
+
+def _load_chunk_id3(format_class):
+    def load(path):
+        return format_class(path).tags
+    return load
+
+
+def _load_vorbis(path):
+    return FLAC(path).tags  # Parses the metadata blocks and stops at the first audio frame.
+
+
+def _load_mp4(path):
+    return MP4(path).tags  # Walks the atom tree; the media data itself is skipped.
+
+
+# Extension -> (tag loader, field normalizer). Each loader only reads metadata.
+_FORMATS = {
+    ".mp3": (_load_id3, _from_id3),
+    ".aiff": (_load_chunk_id3(AIFF), _from_id3),
+    ".aif": (_load_chunk_id3(AIFF), _from_id3),
+    ".wav": (_load_chunk_id3(WAVE), _from_id3),
+    ".flac": (_load_vorbis, _from_vorbis),
+    ".m4a": (_load_mp4, _from_mp4),
+    ".mp4": (_load_mp4, _from_mp4),
+}
+
+# The audio files the scanner picks up: every format whose tags are read above.
+AUDIO_EXTENSIONS = tuple(_FORMATS)
+
+
+def read_file_tags(file_path):
+    """
+    Reads the metadata of an audio file and normalizes it across ID3, Vorbis
+    comments, MP4 atoms and AIFF/WAV ID3 chunks. Returns a dictionary with every
+    key of TAG_FIELDS (None when unknown). Unreadable files yield empty fields.
+    """
+    fields = dict.fromkeys(TAG_FIELDS)
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension in _FORMATS:
+            load, normalize = _FORMATS[extension]
+            tags = load(file_path)
+            if tags is not None:
+                fields.update(normalize(tags))
+        else:
+            audio = MutagenFile(file_path)
+            if audio is not None and audio.tags is not None and isinstance(audio.tags, ID3):
+                fields.update(_from_id3(audio.tags))
+    except (MutagenError, OSError, ValueError):
+        pass  # Unreadable tags; the caller falls back to the filename.
+    release_id = str(fields["discogs_release_id"] or "").strip()
+    fields["discogs_release_id"] = int(release_id) if release_id.isdigit() else None
+    return fields
+
+
+def _write_id3(tags, values):
+    for desc, value in values.items():
+        tags.delall(f"TXXX:{desc}")
+        tags.add(TXXX(encoding=3, desc=desc, text=[value]))
+
+
+def _save_id3(tags, file_path):
+    # Keep ID3v2.3 tags at v2.3: some DJ software does not read v2.4.
+    if tags.version[:2] == (2, 3):
+        tags.update_to_v23()
+        tags.save(file_path, v2_version=3)
+    else:
+        tags.save(file_path)
+
+
+def write_release_tags(file_path, release_id, track_position=None):
+    """
+    Stores the matched Discogs release ID (and track position, if known) in the
+    file's own tags: ID3 TXXX frames (MP3, AIFF, WAV), Vorbis comments (FLAC) or
+    MP4 freeform atoms. Only these tags are changed.
+
+    Returns False for formats that cannot be tagged. Raises MutagenError or OSError
+    if the file cannot be written.
+    """
+    values = {RELEASE_ID_TAG: str(release_id)}
+    if track_position:
+        values[TRACK_POSITION_TAG] = str(track_position)
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".mp3":
+        try:
+            tags = ID3(file_path)
+        except ID3NoHeaderError:
+            tags = ID3()
+        _write_id3(tags, values)
+        _save_id3(tags, file_path)
+    elif extension in (".aiff", ".aif", ".wav"):
+        audio = (AIFF if extension != ".wav" else WAVE)(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        _write_id3(audio.tags, values)
+        if audio.tags.version[:2] == (2, 3):
+            audio.tags.update_to_v23()
+            audio.save(v2_version=3)
+        else:
+            audio.save()
+    elif extension == ".flac":
+        audio = FLAC(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for key, value in values.items():
+            audio[key.lower()] = [value]
+        audio.save()
+    elif extension in (".m4a", ".mp4"):
+        audio = MP4(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for key, value in values.items():
+            audio[_MP4_FREEFORM + key] = [MP4FreeForm(value.encode("utf-8"))]
+        audio.save()
+    else:
+        return False
+    return True
+
+
+def read_tags(file_path, file_name):
+    """
+    Extracts the artist and title from the audio file metadata, falling back to
+    the file name (see name_parser.parse_name). Catalog number, label and track
+    number missing from the tags are taken from the album tag or the file name
+    (e.g. "01 - Artist - Title (Label CAT123)").
+
+    Returns a dictionary with the keys of TAG_FIELDS plus "remixer" and "featuring"
+    (None when unknown). "artist" and "title" are only set if both could be determined.
+    """
+    tags = read_file_tags(file_path)
+    parsed = parse_name(file_name)
+    artist, title = tags["artist"], tags["title"]
+    if not (artist and title):
+        artist, title = parsed["artist"], parsed["title"]
+
+    if artist and title and artist.strip() and title.strip():
+        tags["artist"] = artist.strip()
+        tags["title"] = title.strip()
+    else:
+        tags["artist"] = tags["title"] = None
+
+    if not tags["catno"]:
+        catno, label, _ = find_catno(tags["album"])
+        if catno is None:
+            catno, label = parsed["catno"], parsed["label"]
+        tags["catno"] = catno
+        tags["label"] = tags["label"] or label
+    if tags["tracknumber"] is None:
+        tags["tracknumber"] = parsed["tracknumber"]
+    tags["remixer"], tags["featuring"] = parse_credits(tags["title"])
+    if tags["featuring"] is None:
+        _, tags["featuring"] = parse_credits(tags["artist"])
+    return tags
+
+
+class TagReaderPool:
+    """
+    Reads tags in a pool of worker processes, so that large libraries are parsed
+    in parallel instead of one file at a time.
+
+    processes=0 reads in the calling thread instead. Inside the frozen app bundle
+    worker processes cannot be spawned safely, so it always reads in-thread there.
+    """
+
+    def __init__(self, processes=None):
+        if processes is None:
+            processes = 0 if getattr(sys, "frozen", False) else (os.cpu_count() or 2)
+        self.processes = processes
+        self._executor = None
+        if processes > 0:
+            # "spawn" avoids forking a process that already runs pipeline threads.
+            self._executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def read(self, file_path, file_name):
+        executor = self._executor
+        if executor is not None:
+            try:
+                return executor.submit(read_tags, file_path, file_name).result()
+            except (BrokenProcessPool, RuntimeError):
+                # The workers could not start or died; carry on reading in-thread.
+                self._executor = None
+        return read_tags(file_path, file_name)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
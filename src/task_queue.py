@@ -0,0 +1,261 @@
+# task_queue.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dedup import DUPLICATES_FOLDER
+from organizer import organize_files
+from scanner import scan_audio_files
+
+QUEUE_FILE_NAME = ".musicorganizer-queue.sqlite3"
+
+# Task states:
+#   pending - waiting for a worker
+#   leased  - being processed by a worker until its lease expires
+#   done    - processed; the result is stored with the task
+#   failed  - max_attempts leases ended without a result (e.g. the file fails or crashes every worker)
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_queue_path(folder):
+    """The queue lives in the shared folder itself, where every worker can reach it."""
+    return os.path.join(os.path.abspath(folder), QUEUE_FILE_NAME)
+
+
+class Lease:
+    """A batch of tasks leased by one worker. The token fences out anyone else."""
+
+    def __init__(self, token, worker, paths):
+        self.token = token
+        self.worker = worker
+        self.paths = paths
+
+
+class TaskQueue:
+    """
+    Durable queue of files to organize, shared by several worker processes (on one
+    or more hosts) so that each can look files up with its own Discogs token.
+
+    Workers lease a batch of tasks for a limited time and renew the lease while they
+    work. Results are committed in one transaction, and only while the lease is
+    still held; the tasks of a worker that crashed or hung become available again
+    once its lease expires.
+
+    Parameters:
+      - path: Location of the SQLite database (created if missing).
+      - wal: Use write-ahead logging. WAL needs shared memory between the processes,
+             so it only works when all workers run on the same host; set it to False
+             when workers on several hosts open the queue on a network share.
+      - max_attempts: Leases a task may get before it is marked failed.
+    """
+
+    def __init__(self, path, wal=True, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE.
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute("PRAGMA synchronous=NORMAL" if wal else "PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " path TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " lease TEXT,"
+            " worker TEXT,"
+            " expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT,"
+            " dest TEXT,"
+            " release TEXT,"
+            " updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, path)")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def add(self, paths):
+        """Queues files that are not queued yet. Returns the number added."""
+        now = time.time()
+
+        def work(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (path, state, updated) VALUES (?, ?, ?)",
+                ((os.path.abspath(path), PENDING, now) for path in paths),
+            )
+            return conn.total_changes - before
+        return self._transaction(work)
+
+    def fill(self, folder, batch=1000):
+        """Queues every audio file below folder (outside the Not categorized and Duplicates folders)."""
+        added = 0
+        paths = []
+        for entry in scan_audio_files(folder, skip_names=("Not categorized", DUPLICATES_FOLDER)):
+            paths.append(entry.path)
+            if len(paths) >= batch:
+                added += self.add(paths)
+                paths = []
+        return added + self.add(paths)
+
+    def lease(self, worker, count, seconds):
+        """
+        Leases up to count tasks for seconds. Tasks are handed out in path order, so
+        the tracks of one album usually end up in the same batch. Returns a Lease, or
+        None if no task is available.
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+
+        def work(conn):
+            conn.execute(
+                "UPDATE tasks SET state = ?, lease = NULL, updated = ?"
+                " WHERE (state = ? OR (state = ? AND expires < ?)) AND attempts >= ?",
+                (FAILED, now, PENDING, LEASED, now, self.max_attempts),
+            )
+            paths = [row[0] for row in conn.execute(
+                "SELECT path FROM tasks WHERE state = ? OR (state = ? AND expires < ?) ORDER BY path LIMIT ?",
+                (PENDING, LEASED, now, count),
+            )]
+            conn.executemany(
+                "UPDATE tasks SET state = ?, lease = ?, worker = ?, expires = ?, attempts = attempts + 1, updated = ?"
+                " WHERE path = ?",
+                ((LEASED, token, worker, now + seconds, now, path) for path in paths),
+            )
+            return paths
+        paths = self._transaction(work)
+        return Lease(token, worker, paths) if paths else None
+
+    def renew(self, lease, seconds):
+        """Extends a lease. Returns False if it expired and was taken over by another worker."""
+        now = time.time()
+
+        def work(conn):
+            return conn.execute(
+                "UPDATE tasks SET expires = ?, updated = ? WHERE lease = ? AND state = ?",
+                (now + seconds, now, lease.token, LEASED),
+            ).rowcount
+        return self._transaction(work) > 0
+
+    def complete(self, lease, results):
+        """
+        Stores the results ({path: organize_files result}) of a lease in one transaction
+        and returns its tasks without a result, or with an error, to the queue. Results
+        for tasks that are no longer held by the lease are dropped. Returns the number
+        of results stored.
+        """
+        now = time.time()
+
+        def work(conn):
+            stored = 0
+            for path, result in results.items():
+                if result["status"] == "error":
+                    continue  # Tried again, up to max_attempts.
+                release = json.dumps(result["release"]) if result.get("release") else None
+                stored += conn.execute(
+                    "UPDATE tasks SET state = ?, lease = NULL, status = ?, dest = ?, release = ?, updated = ?"
+                    " WHERE path = ? AND lease = ? AND state = ?",
+                    (DONE, result["status"], result.get("dest"), release, now, path, lease.token, LEASED),
+                ).rowcount
+            conn.execute(
+                "UPDATE tasks SET state = ?, lease = NULL, updated = ? WHERE lease = ? AND state = ?",
+                (PENDING, now, lease.token, LEASED),
+            )
+            return stored
+        return self._transaction(work)
+
+    def counts(self):
+        """Returns the number of tasks per state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        return dict(rows)
+
+    def unfinished(self):
+        """Number of tasks that are pending or leased."""
+        counts = self.counts()
+        return counts.get(PENDING, 0) + counts.get(LEASED, 0)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_worker(queue, discogs_client, folder, action, worker, stop_event=None, batch_size=50,
+               lease_seconds=300, idle_seconds=5, log_callback=None, result_callback=None, **options):
+    """
+    Processes leased batches of the queue with organize_files until no task is left
+    (or stop_event is set). Start one worker per Discogs token: every worker has its
+    own client and rate limiter, so throughput grows with the number of tokens.
+
+    Parameters:
+      - queue: The shared TaskQueue.
+      - discogs_client: This worker's Discogs client.
+      - folder: The folder being organized (the same for all workers).
+      - action: "move" or "copy".
+      - worker: A name for this worker, stored with its leases.
+      - stop_event: (Optional) A threading.Event; the worker stops after the current batch when it is set.
+      - batch_size: Tasks leased at a time.
+      - lease_seconds: How long a lease lasts without renewal; it is renewed while the batch runs.
+      - idle_seconds: Wait between checks while other workers still hold leases.
+      - log_callback / result_callback: (Optional) Passed on to organize_files.
+      - options: Further keyword arguments for organize_files.
+    Returns the number of files processed.
+    """
+    def log(message):
+        if log_callback:
+            log_callback(message)
+
+    processed = 0
+    while stop_event is None or not stop_event.is_set():
+        lease = queue.lease(worker, batch_size, lease_seconds)
+        if lease is None:
+            if queue.unfinished() == 0:
+                break
+            # Leases of other workers may still expire and come back to the queue.
+            time.sleep(idle_seconds)
+            continue
+
+        log(f"Leased {len(lease.paths)} files")
+        results = {}
+        lost = threading.Event()
+        finished = threading.Event()
+
+        def on_result(result):
+            results[result["path"]] = result
+            if result_callback:
+                result_callback(result)
+
+        def keep_alive():
+            while not finished.wait(lease_seconds / 3):
+                if not queue.renew(lease, lease_seconds):
+                    lost.set()
+                    return
+
+        renewer = threading.Thread(target=keep_alive, daemon=True)
+        renewer.start()
+        try:
+            organize_files(discogs_client, folder, action, log_callback=log_callback,
+                           result_callback=on_result, paths=lease.paths, **options)
+        finally:
+            finished.set()
+            renewer.join()
+            stored = queue.complete(lease, results)
+        processed += stored
+        if lost.is_set():
+            log(f"Lease expired while working; {len(results) - stored} results were not stored")
+    return processed
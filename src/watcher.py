@@ -0,0 +1,259 @@
+# watcher.py
+import os
+import select
+import struct
+import sys
+import time
+from dedup import DUPLICATES_FOLDER
+from organizer import organize_files
+from scanner import AUDIO_EXTENSIONS, is_output_dir, scan_audio_files
+
+# inotify event bits (sys/inotify.h).
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+SKIP_NAMES = ("Not categorized", DUPLICATES_FOLDER)
+
+_inotify = None
+if sys.platform.startswith("linux"):
+    try:
+        import ctypes
+        import ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        _libc.inotify_init1.argtypes = (ctypes.c_int,)
+        _libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        _inotify = _libc
+    except (OSError, AttributeError):
+        _inotify = None
+
+
+class InotifyWatcher:
+    """
+    Reports the audio files written or moved into folder (or any folder below it),
+    using Linux inotify. New subfolders are watched as soon as they appear.
+
+    Raises OSError if inotify is unavailable or the watch limit is reached.
+    """
+
+    def __init__(self, folder, skip_names=SKIP_NAMES):
+        if _inotify is None:
+            raise OSError("inotify is not available")
+        self.skip_names = skip_names
+        self.overflowed = False
+        self._dirs = {}
+        self._fd = _inotify.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            self._watch_tree(folder)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch_tree(self, folder):
+        for directory, subdirs, _ in os.walk(folder):
+            # Organized output is not watched; new files only arrive outside it.
+            subdirs[:] = [name for name in subdirs
+                          if name not in self.skip_names and not is_output_dir(os.path.join(directory, name))]
+            wd = _inotify.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self._dirs[wd] = directory
+
+    def poll(self, timeout):
+        """Waits up to timeout seconds and returns the paths of files that changed."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # Events were dropped; the caller has to look at the whole folder.
+                self.overflowed = True
+                continue
+            if mask & (_IN_IGNORED | _IN_DELETE_SELF):
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if name not in self.skip_names and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    try:
+                        self._watch_tree(path)
+                    except OSError:
+                        continue
+                    # Files may have landed in the new folder before it was watched.
+                    paths.extend(entry.path for entry in scan_audio_files(path, skip_names=self.skip_names))
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Reports new or changed audio files by scanning folder every `interval` seconds.
+    Used where inotify is not available (macOS, Windows, network shares).
+    """
+
+    def __init__(self, folder, interval=5.0, skip_names=SKIP_NAMES):
+        self.folder = folder
+        self.interval = interval
+        self.skip_names = skip_names
+        self.overflowed = False
+        self._next = time.monotonic() + interval
+        self._seen = self._snapshot()
+
+    def _snapshot(self):
+        seen = {}
+        for entry in scan_audio_files(self.folder, skip_names=self.skip_names):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            seen[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def poll(self, timeout):
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self._next = time.monotonic() + self.interval
+        seen = self._snapshot()
+        changed = [path for path, state in seen.items() if self._seen.get(path) != state]
+        self._seen = seen
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(folder, poll_interval=5.0):
+    """Returns an InotifyWatcher for folder, or a PollingWatcher where inotify cannot be used."""
+    try:
+        return InotifyWatcher(folder)
+    except OSError:
+        return PollingWatcher(folder, poll_interval)
+
+
+class Debouncer:
+    """
+    Holds back files that are still being written: a file is ready once its size
+    and modification time have not changed for `quiet_seconds`.
+    """
+
+    def __init__(self, quiet_seconds=2.0):
+        self.quiet_seconds = quiet_seconds
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, path):
+        # A new event restarts the quiet period.
+        self._pending[path] = (None, time.monotonic())
+
+    def ready(self):
+        """Returns (and forgets) the files whose size and mtime are stable."""
+        now = time.monotonic()
+        ready = []
+        for path, (state, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]  # Deleted or moved away before it settled.
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != state:
+                self._pending[path] = (current, now)
+            elif now - since >= self.quiet_seconds and stat.st_size > 0:
+                del self._pending[path]
+                ready.append(path)
+        return ready
+
+
+def watch_folder(discogs_client, folder, action, stop_event, log_callback=None, result_callback=None,
+                 quiet_seconds=2.0, poll_interval=5.0, scan_existing=False, **options):
+    """
+    Keeps organizing the audio files that appear in folder until stop_event is set.
+
+    Only the new files go through tag reading, lookup and the file operations; the
+    client, its cache and the local index stay loaded between files, so a dropped
+    track is organized within seconds of being completely written.
+
+    Parameters:
+      - discogs_client: The Discogs client object.
+      - folder: The folder to watch; organized files are placed below it.
+      - action: "move" or "copy".
+      - stop_event: A threading.Event; watching stops when it is set.
+      - log_callback: (Optional) A function to call with log messages.
+      - result_callback: (Optional) Called with the result of every file (see organize_files).
+      - quiet_seconds: How long size and mtime must stay unchanged before a file is organized.
+      - poll_interval: Seconds between scans when inotify cannot be used.
+      - scan_existing: Organize the files already in folder before watching.
+      - options: Further keyword arguments for organize_files (journal, local_index, ...).
+    """
+    def log(message):
+        if log_callback:
+            log_callback(message)
+
+    folder = os.path.abspath(folder)
+    # Files this process placed are reported by the watcher too; they are not new.
+    placed = set()
+
+    def on_result(result):
+        if result.get("dest"):
+            placed.add(os.path.abspath(result["dest"]))
+        if result_callback:
+            result_callback(result)
+
+    # Batches are small, so tags are read in-thread rather than by spawning processes.
+    options.setdefault("tag_workers", 0)
+
+    def organize(paths=None):
+        organize_files(discogs_client, folder, action, log_callback=log_callback,
+                       result_callback=on_result, paths=paths, **options)
+
+    watcher = create_watcher(folder, poll_interval)
+    log(f"Watching {folder} ({'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'})")
+    if scan_existing:
+        organize()
+    debouncer = Debouncer(quiet_seconds)
+    try:
+        while not stop_event.is_set():
+            for path in watcher.poll(min(quiet_seconds / 2, 1.0)):
+                if path.lower().endswith(AUDIO_EXTENSIONS) and path not in placed:
+                    debouncer.add(path)
+            if watcher.overflowed:
+                log("Too many changes at once; scanning the whole folder.")
+                watcher.overflowed = False
+                organize()
+                continue
+            ready = debouncer.ready()
+            if ready:
+                log(f"Organizing {len(ready)} new file(s)")
+                organize(ready)
+    finally:
+        watcher.close()
+    log("Stopped watching.")
@@ -0,0 +1,113 @@
+# test_discogs_dump.py
+import pytest
+from discogs_dump import LocalIndex, iter_releases
+
+DUMP = """<?xml version="1.0" encoding="UTF-8"?>
+<releases>
+<release id="1" status="Accepted">
+  <artists><artist><id>10</id><name>Ana Bell</name></artist></artists>
+  <title>Night Drive EP</title>
+  <labels><label name="Dekmantel" catno="DKMNTL 045" id="100"/></labels>
+  <country>Netherlands</country>
+  <released>2019-05-00</released>
+  <genres><genre>Electronic</genre></genres>
+  <styles><style>Techno</style><style>Acid</style></styles>
+  <tracklist>
+    <track><position>A1</position><title>Night Drive</title></track>
+    <track><position>A2</position><title>Café Noir</title></track>
+    <track><position>B1</position><title>Lights Out</title></track>
+  </tracklist>
+</release>
+<release id="2" status="Accepted">
+  <artists><artist><id>20</id><name>Bruno Cole (2)</name></artist></artists>
+  <title>Harbour Lights</title>
+  <labels><label name="Kompakt" catno="KOM-123" id="200"/></labels>
+  <released>Unknown</released>
+  <tracklist>
+    <track><position>1</position><title>Harbour Lights</title></track>
+    <track><position>2</position><title>Low Tide</title></track>
+  </tracklist>
+</release>
+<release id="3" status="Accepted">
+  <artists><artist><id>30</id><name>Cara Dune</name></artist></artists>
+  <title>Desert Bloom</title>
+  <labels></labels>
+  <released>2021</released>
+  <tracklist>
+    <track><position>1</position><title>Desert Bloom</title></track>
+  </tracklist>
+</release>
+</releases>
+"""
+
+
+@pytest.fixture
+def releases(tmp_path):
+    path = tmp_path / "discogs_releases.xml"
+    path.write_text(DUMP, encoding="utf-8")
+    return list(iter_releases(str(path)))
+
+
+@pytest.fixture
+def index(releases):
+    index = LocalIndex(":memory:")
+    index.ingest(releases)
+    yield index
+    index.close()
+
+
+def test_parse_release(releases):
+    assert [r["id"] for r in releases] == [1, 2, 3]
+    first = releases[0]
+    assert first["title"] == "Night Drive EP"
+    assert first["year"] == 2019
+    assert first["country"] == "Netherlands"
+    assert first["genres"] == ["Electronic"]
+    assert first["styles"] == ["Techno", "Acid"]
+    assert first["artists"] == [{"id": 10, "name": "Ana Bell"}]
+    assert first["labels"] == [{"id": 100, "name": "Dekmantel", "catno": "DKMNTL 045"}]
+    assert first["catno"] == "DKMNTL 045"
+    assert [t["position"] for t in first["tracklist"]] == ["A1", "A2", "B1"]
+
+
+def test_parse_release_missing_fields(releases):
+    second, third = releases[1], releases[2]
+    assert second["year"] == 0
+    assert second["country"] == ""
+    assert second["genres"] == [] and second["styles"] == []
+    assert third["labels"] == [] and third["catno"] == ""
+
+
+def test_search(index):
+    assert len(index) == 3
+    assert [r["id"] for r in index.search("Ana Bell Night Drive")][0] == 1
+    # Track titles are indexed, and diacritics do not matter.
+    assert [r["id"] for r in index.search("cafe noir")] == [1]
+    # Discogs "(2)" suffixes are not part of the indexed artist name.
+    assert [r["id"] for r in index.search("Bruno Cole Low Tide")][0] == 2
+    assert index.search("nothing like this") == []
+    assert index.search("  ") == []
+
+
+@pytest.mark.parametrize("catno", ["DKMNTL045", "dkmntl 045", "DKMNTL-045"])
+def test_search_catno(index, catno):
+    assert [r["id"] for r in index.search_catno(catno)] == [1]
+
+
+def test_search_catno_no_match(index):
+    assert [r["id"] for r in index.search_catno("KOM 123")] == [2]
+    assert index.search_catno("KOM 12") == []
+    assert index.search_catno("") == []
+
+
+def test_release(index, releases):
+    assert index.release(3) == releases[2]
+    assert index.release(4) is None
+
+
+def test_ingest_replaces(index, releases):
+    renamed = dict(releases[2], title="Desert Bloom (Remastered)")
+    index.ingest([renamed])
+    assert len(index) == 3
+    assert index.release(3)["title"] == "Desert Bloom (Remastered)"
+    assert [r["id"] for r in index.search("Cara Dune")] == [3]
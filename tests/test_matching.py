@@ -0,0 +1,47 @@
+# test_matching.py
+from matching import best_match, prepare, similarity, text_similarity
+
+
+def test_identical_after_normalization():
+    assert text_similarity("Café Noir (Original Mix)", "cafe noir") == 1.0
+    assert text_similarity("Ana Bell (2)", "Ana Bell") == 1.0
+
+
+def test_reordered_tokens():
+    assert text_similarity("Night Drive Ana Bell", "Ana Bell - Night Drive") == 1.0
+    assert text_similarity("Noir, Cafe", "Cafe Noir") == 1.0
+
+
+def test_duplicated_tokens_are_not_a_perfect_match():
+    # Tokens are compared as multisets: a repeated word is a difference.
+    score = text_similarity("Lights Out Lights Out", "Lights Out")
+    assert 0.5 <= score < 1.0
+    assert text_similarity("Lights Out", "Lights Out Lights Out") == score
+
+
+def test_subset_is_not_a_perfect_match():
+    assert text_similarity("Lights", "Lights Out") < 1.0
+    assert text_similarity("Night Drive", "Night Drive Extended") < 1.0
+
+
+def test_partial_overlap_beats_plain_ratio():
+    reordered = text_similarity("Out Lights Tonight", "Lights Out")
+    unrelated = text_similarity("Harbour Tide", "Lights Out")
+    assert reordered > unrelated
+
+
+def test_empty_strings():
+    assert text_similarity("", "") == 1.0
+    assert text_similarity("", "Lights Out") == 0.0
+    assert text_similarity(None, "Lights Out") == 0.0
+
+
+def test_floor_skips_hopeless_comparisons():
+    assert similarity(prepare("ab"), prepare("a much longer title"), floor=0.9) == 0.0
+
+
+def test_best_match():
+    tracks = ["Night Drive", "Café Noir", "Lights Out"]
+    assert best_match("cafe noir", tracks) == (1, 1.0)
+    assert best_match("Out Lights", tracks)[0] == 2
+    assert best_match("Harbour", tracks, floor=0.7) == (None, 0.0)
@@ -0,0 +1,46 @@
+# test_name_parser.py
+import pytest
+from name_parser import find_catno, normalize_catno
+
+
+@pytest.mark.parametrize("catno, expected", [
+    ("DKMNTL045", "DKMNTL045"),
+    ("dkmntl 045", "DKMNTL045"),
+    ("DKMNTL-045", "DKMNTL045"),
+    ("kom.123", "KOM123"),
+    ("BAR_12x", "BAR12X"),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_catno(catno, expected):
+    assert normalize_catno(catno) == expected
+
+
+@pytest.mark.parametrize("text, catno, label, rest", [
+    ("Night Drive [DKMNTL045]", "DKMNTL045", None, "Night Drive"),
+    ("Night Drive (Dekmantel DKMNTL045)", "DKMNTL045", "Dekmantel", "Night Drive"),
+    ("Low Tide (KOM 123) extra", "KOM 123", None, "Low Tide extra"),
+    ("Track (WARP-1)", "WARP-1", None, "Track"),
+    ("Track (BAR12X)", "BAR12X", None, "Track"),
+])
+def test_find_catno(text, catno, label, rest):
+    assert find_catno(text) == (catno, label, rest)
+
+
+@pytest.mark.parametrize("text", [
+    "Track (HDB 2007)",   # A year dates the release.
+    "Track (LP 1999)",
+    "Track (UK 12)",      # Country of the pressing.
+    "Track (MK2)",        # Version, not a catalog number.
+    "Track (CD 2)",
+    "Track (Vol 3)",
+    "Track (Original Mix)",
+    "Track",
+    "",
+])
+def test_find_catno_not_a_catno(text):
+    assert find_catno(text) == (None, None, text)
+
+
+def test_find_catno_skips_to_real_catno():
+    assert find_catno("Track (UK 12) [KOM 123]") == ("KOM 123", None, "Track (UK 12)")